@@ -0,0 +1,334 @@
+import argparse # for the command line flags
+import hashlib # for identifying the version of findrepl.py being measured
+import json # for the results file
+import os # for the corpus directories
+import platform # for describing the machine in the results
+import random # for generating the corpus and rules deterministically
+import re # for checking the results of the rule sets
+import shutil # for removing the corpus
+import sys # for the Python version in the results
+import tempfile # for the corpus directory
+import time # for timing the runs
+
+import findrepl
+
+# words the corpus is made of, rules being built from the same words so they match
+WORDS = ["alpha", "beta", "gamma", "delta", "omega", "hello", "world", "price", "total", "order", "item", "color",
+         "colour", "center", "centre", "search", "replace", "beautiful", "soup", "regex", "sample", "value", "status", "number"]
+
+# corpus and rule sizes for each scale: (text files, HTML files, bytes per file, bytes of the XML file)
+SCALES = {
+    "small": (20, 20, 20_000, 2_000_000),
+    "medium": (200, 200, 50_000, 50_000_000),
+    "large": (1000, 1000, 100_000, 500_000_000),
+}
+
+# the engines measured for each kind of file, as the settings selecting them
+ENGINES = {
+    "text": {"lines": {"HYPERTEXT_SUPPORT": "NO", "PLAINTEXT_MODE": "LINES"},
+             "whole_file": {"HYPERTEXT_SUPPORT": "NO", "PLAINTEXT_MODE": "WHOLE_FILE"}},
+    "html": {"soup": {"HYPERTEXT_SUPPORT": "YES", "HYPERTEXT_ENGINE": "SOUP"},
+             "stream": {"HYPERTEXT_SUPPORT": "YES", "HYPERTEXT_ENGINE": "STREAM"}},
+    "xml": {"soup": {"HYPERTEXT_SUPPORT": "YES", "HYPERTEXT_ENGINE": "SOUP"},
+            "stream": {"HYPERTEXT_SUPPORT": "YES", "HYPERTEXT_ENGINE": "STREAM"}},
+}
+EXTENSIONS = {"text": "txt", "html": "html", "xml": "xml"}
+
+# returns a line of words and numbers, about length characters long
+def get_sentence(rng: random.Random, length: int) -> str:
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS) if rng.random() < 0.85 else str(rng.randrange(100000))
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)
+
+def write_text_file(rng: random.Random, file_name: str, size: int):
+    with open(file_name, "w", encoding="utf-8") as f:
+        written = 0
+        while written < size:
+            line = get_sentence(rng, rng.randrange(20, 120)) + "\n"
+            f.write(line)
+            written += len(line)
+
+# HTML files have scripts, styles, comments and entities, every fifth file having a '<? ... ?>' tag
+def write_html_file(rng: random.Random, file_name: str, size: int, with_unidentified_tag: bool):
+    with open(file_name, "w", encoding="utf-8") as f:
+        f.write("<!DOCTYPE html>\n<html><head><title>" + get_sentence(rng, 30) + "</title>\n")
+        f.write("<style>p.hello { color: red; } /* " + get_sentence(rng, 40) + " */</style>\n")
+        f.write('<script>var s = "' + get_sentence(rng, 40) + '"; if (a < b) { s += "<p>hello</p>"; }</script>\n</head><body>\n')
+        if with_unidentified_tag:
+            f.write("<?php echo 'hello world'; ?>\n")
+        written = 0
+        while written < size:
+            kind = rng.random()
+            if kind < 0.1:
+                chunk = "<!-- " + get_sentence(rng, 40) + " -->\n"
+            elif kind < 0.2:
+                chunk = '<div class="' + rng.choice(WORDS) + '"><a href="/' + rng.choice(WORDS) + '">' + get_sentence(rng, 20) + "</a></div>\n"
+            elif kind < 0.25:
+                chunk = "<script>console.log('" + get_sentence(rng, 30) + "');</script>\n"
+            else:
+                chunk = "<p>" + get_sentence(rng, rng.randrange(40, 200)).replace(" total ", " total &amp; ") + "</p>\n"
+            f.write(chunk)
+            written += len(chunk)
+        f.write("</body></html>\n")
+
+# a single large XML file of records, with namespaces, comments and CDATA
+def write_xml_file(rng: random.Random, file_name: str, size: int):
+    with open(file_name, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://example.com/feed" xmlns:x="http://example.com/x">\n')
+        written = 0
+        number = 0
+        while written < size:
+            number += 1
+            chunk = (f'  <entry id="{number}"><title>{get_sentence(rng, 30)}</title><x:note>{get_sentence(rng, 60)}</x:note>'
+                     + (f"<!-- {get_sentence(rng, 20)} -->" if number % 10 == 0 else "")
+                     + (f"<![CDATA[{get_sentence(rng, 20)}]]>" if number % 25 == 0 else "")
+                     + "</entry>\n")
+            f.write(chunk)
+            written += len(chunk)
+        f.write("</feed>\n")
+
+# writes the corpus of a kind of file into directory, returning the number of bytes written
+def generate_corpus(kind: str, directory: str, scale: str, seed: int) -> int:
+    text_files, html_files, file_size, xml_size = SCALES[scale]
+    rng = random.Random(f"{seed}-{kind}")
+    os.makedirs(directory, exist_ok=True)
+    if kind == "text":
+        for i in range(text_files):
+            write_text_file(rng, os.path.join(directory, f"file{i}.txt"), file_size)
+    elif kind == "html":
+        for i in range(html_files):
+            write_html_file(rng, os.path.join(directory, f"page{i}.html"), file_size, i % 5 == 4)
+    else:
+        write_xml_file(rng, os.path.join(directory, "feed.xml"), xml_size)
+    return sum(entry.stat().st_size for entry in os.scandir(directory))
+
+# returns count rules made of literal_ratio literal rules, the others being regex, most of them not matching anything
+def generate_rules(count: int, literal_ratio: float, seed: int) -> list[findrepl.ReplacementStr]:
+    rng = random.Random(f"{seed}-rules-{count}")
+    strings = []
+    for i in range(count):
+        matching = i % 20 == 0 # a few rules match the corpus, the others only have to be ruled out
+        word = rng.choice(WORDS) if matching else rng.choice(WORDS) + str(i)
+        if rng.random() < literal_ratio:
+            if matching and rng.random() < 0.5:
+                word = word + " " + rng.choice(WORDS)
+            strings.append(findrepl.ReplacementStr(word, word.upper()))
+        else:
+            pattern = rng.choice([r"\b{0}\b", r"{0}(\d+)", r"(?:{0}|{0}s) [a-z]+", r"{0}[ae]?", r"\d+ {0}"]).format(word)
+            strings.append(findrepl.ReplacementStr(pattern, f"<{i}>"))
+    return strings
+
+# rules whose regex relies on group numbers, flags or anchors, which are easily broken when rules are indexed or merged
+CHECK_RULES = [("(a)?(?(1)b|c)", "X"), (r"(\w)\1", r"<\1>"), ("(?P<w>ab)(?P=w)", "Y"), ("(?i)AB", "z"), ("(?i:ab)c", "Q"),
+               ("a|b", "c"), ("^ab", "S"), ("b$", "E"), (r"\bab\b", "W"), ("(a)(b)?", r"\2\1")]
+CHECK_TEXTS = ["ab", "c", "aab", "abab", "ABc", "xaby", "ba", "a b", "cab ab", "abc abc", ""]
+
+# checks that a rule set gives the same result on each text as applying its rules one after another with re.sub,
+# returning the texts which do not
+def check_rules(strings: list[findrepl.ReplacementStr], texts: list[str]) -> list[str]:
+    rule_set = findrepl.build_rule_set(strings)
+    mismatches = []
+    for text in texts:
+        expected = text
+        for string in strings:
+            expected = re.sub(string.find, string.replace, expected)
+        if rule_set.apply(text)[0] != expected:
+            mismatches.append(text)
+    return mismatches
+
+# files whose output is easily broken by an engine: (name, settings, extension, rules, contents, expected contents, changes)
+CHECK_FILES = [
+    ("XML prefixes sharing a namespace", {"HYPERTEXT_SUPPORT": "YES", "HYPERTEXT_ENGINE": "STREAM", "BANNED_TAGS": "p:skip"}, "xml",
+     [("foo", "bar")], b'<r xmlns="urn:a" xmlns:p="urn:a" xmlns:q="urn:a"><q:e>foo</q:e><e>foo</e><p:skip>foo</p:skip></r>',
+     b'<r xmlns="urn:a" xmlns:p="urn:a" xmlns:q="urn:a"><q:e>bar</q:e><e>bar</e><p:skip>foo</p:skip></r>', 2),
+    ("non-ASCII literal brought in by a replacement, mmap", {"HYPERTEXT_SUPPORT": "NO", "PLAINTEXT_MODE": "WHOLE_FILE", "MMAP_MIN_SIZE": "1"}, "txt",
+     [("X", "é"), ("é" * 20, "OK")], ("é" * 19 + "X\n").encode("utf-8"), b"OK\n", 2),
+    ("non-ASCII literal brought in by a replacement, bytes", {"HYPERTEXT_SUPPORT": "NO", "PLAINTEXT_MODE": "WHOLE_FILE", "BYTES_MODE": "YES"}, "txt",
+     [("X", "é"), ("é" * 20, "OK")], ("é" * 19 + "X\n").encode("utf-8"), b"OK\n", 2),
+    ("anchored rule on \\r\\n line endings, bytes", {"HYPERTEXT_SUPPORT": "NO", "BYTES_MODE": "YES"}, "txt",
+     [("foo$", "bar")], b"foo\r\nfoo\r\n", b"bar\nbar\n", 2),
+    ("anchored rule on \\r\\n line endings, whole file bytes", {"HYPERTEXT_SUPPORT": "NO", "PLAINTEXT_MODE": "WHOLE_FILE", "BYTES_MODE": "YES"}, "txt",
+     [("foo$", "bar")], b"foo\r\nfoo\r\n", b"bar\nbar\n", 2),
+    ("anchored rule on \\r\\n line endings, mmap", {"HYPERTEXT_SUPPORT": "NO", "PLAINTEXT_MODE": "WHOLE_FILE", "MMAP_MIN_SIZE": "1"}, "txt",
+     [("foo$", "bar")], b"foo\r\nfoo\r\n", b"bar\nbar\n", 2),
+    ("entities of a changed HTML text", {"HYPERTEXT_SUPPORT": "YES", "HYPERTEXT_ENGINE": "STREAM"}, "html",
+     [("Tom", "Tim"), ("foo", "bar")], b"<p>Tom &amp; Jerry&nbsp;foo &quot;x&quot; &#169; 1 > 0</p>",
+     b"<p>Tim &amp; Jerry&nbsp;bar &quot;x&quot; &#169; 1 > 0</p>", 2),
+    ("entities of a changed HTML text, bytes", {"HYPERTEXT_SUPPORT": "YES", "HYPERTEXT_ENGINE": "STREAM", "BYTES_MODE": "YES"}, "html",
+     [("Tom", "Tim"), ("foo", "bar")], b"<p>Tom &amp; Jerry&nbsp;foo &quot;x&quot; &#169; 1 > 0</p>",
+     b"<p>Tim &amp; Jerry&nbsp;bar &quot;x&quot; &#169; 1 > 0</p>", 2),
+    ("entity the encoding cannot hold", {"HYPERTEXT_SUPPORT": "YES", "HYPERTEXT_ENGINE": "STREAM", "ENCODING": "ascii"}, "html",
+     [("foo", "bar")], b"<p>foo &euro;</p>", b"<p>bar &euro;</p>", 1),
+]
+
+# processes each of CHECK_FILES in a temporary directory, returning the names of those whose output or number of changes
+# is not the expected one
+def check_files() -> list[str]:
+    mismatches = []
+    for name, settings, extension, rules, contents, expected, expected_changes in CHECK_FILES:
+        directory = tempfile.mkdtemp(prefix="findrepl-check.")
+        try:
+            findrepl.reset_settings()
+            for key, value in settings.items():
+                findrepl.apply_setting(key, value, verbose=False)
+            findrepl.SETTINGS.PROCESS_FILES_IN_CURRENT_DIR = False
+            findrepl.SETTINGS.FILES_CUSTOM_DIR = directory
+            findrepl.SETTINGS.EXTENSIONS = [extension]
+            findrepl.SETTINGS.OVERWRITE_FILES = True
+            findrepl.SETTINGS.LOGS_FILE_NAME = os.path.join(directory, "check.log")
+            file_name = os.path.join(directory, f"check.{extension}")
+            with open(file_name, "wb") as f:
+                f.write(contents)
+            rule_set = findrepl.build_rule_set([findrepl.ReplacementStr(find, replace) for find, replace in rules])
+            with open(os.devnull, "w") as devnull:
+                stdout = sys.stdout
+                sys.stdout = devnull # the engines print the files they write
+                try:
+                    run_result = findrepl.process_files(list(findrepl.find_files()), rule_set)
+                finally:
+                    sys.stdout = stdout
+            with open(file_name, "rb") as f:
+                output = f.read()
+            if output != expected or run_result.changes != expected_changes:
+                mismatches.append(f"{name}: {output!r} with {run_result.changes} changes")
+        finally:
+            shutil.rmtree(directory)
+    findrepl.reset_settings()
+    return mismatches
+
+# checks the results of the rule sets on the edge case rules, on their own and all together, then on the generated rules
+# and the lines of a generated text, then the output of CHECK_FILES, printing every mismatch. Returns the number of mismatches.
+def check(rule_counts: list[int], literal_ratio: float, seed: int) -> int:
+    findrepl.reset_settings()
+    rules = [findrepl.ReplacementStr(find, replace) for find, replace in CHECK_RULES]
+    cases = [(f"rule {find!r}", [rule]) for rule, (find, replace) in zip(rules, CHECK_RULES)] + [("all edge case rules", rules)]
+    rng = random.Random(f"{seed}-check")
+    lines = [get_sentence(rng, 200) for i in range(50)]
+    cases += [(f"{count} generated rules", generate_rules(count, literal_ratio, seed)) for count in rule_counts]
+    mismatches = 0
+    for name, strings in cases:
+        for text in check_rules(strings, CHECK_TEXTS + lines):
+            print(f"Mismatch with {name} on {text!r}")
+            mismatches += 1
+    for mismatch in check_files():
+        print(f"Mismatch with {mismatch}")
+        mismatches += 1
+    print(f"{len(cases)} rule sets and {len(CHECK_FILES)} files checked, {mismatches} mismatches.")
+    return mismatches
+
+# sets up the settings of a scenario, every file of directory being processed and written next to it
+def configure(kind: str, engine: str, directory: str, logs_file_name: str, workers: int):
+    findrepl.reset_settings()
+    for key, value in ENGINES[kind][engine].items():
+        findrepl.apply_setting(key, value, verbose=False)
+    findrepl.SETTINGS.PROCESS_FILES_IN_CURRENT_DIR = False
+    findrepl.SETTINGS.FILES_CUSTOM_DIR = directory
+    findrepl.SETTINGS.EXTENSIONS = [EXTENSIONS[kind]]
+    findrepl.SETTINGS.OVERWRITE_FILES = False
+    findrepl.SETTINGS.LOGS_FILE_NAME = logs_file_name
+    findrepl.SETTINGS.WORKERS = workers
+
+# removes the files written by a run, so the next run finds the same corpus
+def remove_outputs(directory: str):
+    for entry in os.scandir(directory):
+        if findrepl.SETTINGS.NEW_FILE_NAMES_SUFFIX + "." in entry.name:
+            os.remove(entry.path)
+
+# runs a scenario once, returning its end to end time and the time spent in each stage
+def run_scenario(strings: list[findrepl.ReplacementStr], directory: str) -> dict:
+    started = time.perf_counter()
+    rule_set = findrepl.build_rule_set(strings)
+    compiled = time.perf_counter()
+    files = list(findrepl.find_files())
+    discovered = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull # the engines print the files they write
+        try:
+            run_result = findrepl.process_files(files, rule_set)
+        finally:
+            sys.stdout = stdout
+    finished = time.perf_counter()
+    remove_outputs(directory)
+    stages = {"compile": compiled - started, "discovery": discovered - compiled}
+    stages.update(run_result.timings)
+    return {"seconds": finished - started, "stages": stages, "files": run_result.files, "changes": run_result.changes,
+            "skipped": len(run_result.files_to_skip)}
+
+# returns the version of findrepl.py being measured, as the hash of its contents
+def get_version() -> str:
+    with open(findrepl.__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+# prints how the results compare with those of an earlier results file, scenario by scenario
+def compare(results: dict, baseline_file_name: str):
+    with open(baseline_file_name, "r", encoding="utf-8") as f:
+        baseline = {scenario["name"]: scenario for scenario in json.load(f)["scenarios"]}
+    print(f"{'scenario':40} {'before':>10} {'after':>10} {'speedup':>8}")
+    for scenario in results["scenarios"]:
+        before = baseline.get(scenario["name"])
+        if before is None:
+            continue
+        print(f"{scenario['name']:40} {before['seconds']:10.3f} {scenario['seconds']:10.3f} {before['seconds'] / scenario['seconds']:7.2f}x")
+
+def get_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Measures findrepl on a generated corpus, every run with the same seed using the same files and rules.")
+    parser.add_argument("--scale", choices=list(SCALES), default="small", help="size of the corpus (default: small)")
+    parser.add_argument("--rules", default="10,1000,50000", help="comma separated numbers of rules, each measured on its own (default: 10,1000,50000)")
+    parser.add_argument("--literal-ratio", type=float, default=0.8, help="share of literal rules, the others being regex (default: 0.8)")
+    parser.add_argument("--kinds", default="text,html,xml", help="comma separated kinds of files to measure (default: text,html,xml)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each scenario, the fastest being kept (default: 3)")
+    parser.add_argument("--workers", type=int, default=1, help="WORKERS setting of every run (default: 1)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the corpus and rules (default: 1)")
+    parser.add_argument("--dir", help="directory for the corpus, kept afterwards (default: a temporary directory, removed afterwards)")
+    parser.add_argument("--output", default="benchmark-results.json", help="results file (default: benchmark-results.json)")
+    parser.add_argument("--compare", metavar="RESULTS", help="earlier results file to compare with")
+    parser.add_argument("--check", action="store_true", help="instead of measuring, checks that the rule sets give the same results as applying each rule in turn with re.sub")
+    return parser
+
+def main(argv: list[str] = None) -> int:
+    args = get_argument_parser().parse_args(argv)
+    if args.check:
+        return 1 if check([int(count) for count in args.rules.split(",")], args.literal_ratio, args.seed) else 0
+    root_dir = args.dir or tempfile.mkdtemp(prefix="findrepl-benchmark.")
+    results = {
+        "version": get_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "settings": {"scale": args.scale, "literal_ratio": args.literal_ratio, "repeat": args.repeat, "workers": args.workers, "seed": args.seed},
+        "scenarios": [],
+    }
+    try:
+        for kind in args.kinds.split(","):
+            directory = os.path.join(root_dir, kind)
+            corpus_bytes = generate_corpus(kind, directory, args.scale, args.seed)
+            for rule_count in [int(count) for count in args.rules.split(",")]:
+                strings = generate_rules(rule_count, args.literal_ratio, args.seed)
+                for engine in ENGINES[kind]:
+                    configure(kind, engine, directory, os.path.join(root_dir, f"{kind}-{engine}.log"), args.workers)
+                    runs = [run_scenario(strings, directory) for i in range(args.repeat)]
+                    best = min(runs, key=lambda run: run["seconds"])
+                    scenario = {"name": f"{kind}/{engine}/{rule_count}", "kind": kind, "engine": engine, "rules": rule_count,
+                                "bytes": corpus_bytes, "mb_per_second": corpus_bytes / best["seconds"] / 1e6, **best,
+                                "all_seconds": [run["seconds"] for run in runs]}
+                    results["scenarios"].append(scenario)
+                    print(f"{scenario['name']:40} {best['seconds']:8.3f}s {scenario['mb_per_second']:8.2f} MB/s {best['changes']:9} changes")
+    finally:
+        if not args.dir:
+            shutil.rmtree(root_dir)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results have been saved to {args.output}.")
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
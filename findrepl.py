@@ -1,6 +1,33 @@
 from datetime import datetime # for logs
+import time # for measuring how long each stage of processing takes
 import re # for regex support
 import os # for scanning directories, deleting files, etc
+import multiprocessing # for processing files with multiple workers
+import itertools # for chaining files as they are found
+import fnmatch # for include/exclude globs
+import hashlib # for the manifest of processed files
+import json # for the manifest of processed files
+import io # for reading lines from file contents already in memory
+import html # for unescaping entities before looking for literals in hypertext files
+import tempfile # for overwriting files atomically
+import shutil # for keeping the permissions of overwritten files
+import mmap # for processing large plaintext files without loading them
+import codecs # for checking whether an encoding can be processed as bytes
+import contextlib # for empty files, which cannot be memory-mapped
+import threading # for writing logs in the background
+import queue # for handing batches of logs to the writer thread
+import heapq # for keeping the slowest files of a profiled run
+import statistics # for comparing rules in the profile report
+import select # for waiting on file system events in watch mode
+import struct # for reading inotify events
+import ctypes # for inotify, which is not in the standard library
+import difflib # for keeping the entities of the parts of a text node the rules left unchanged
+try: # for finding the literal strings a regex requires
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError: # Python versions before 3.11
+    import sre_parse
+    import sre_constants
 
 # basic function that checks the validity of a regex string, some_reg provided
 def valid_regex(some_reg: str):
@@ -19,6 +46,567 @@ class ReplacementStr():
         self.find = find
         self.replace = replace
 
+# Literals longer than this are shortened, any prefix of a required literal being required as well
+MAX_LITERAL_LENGTH = 32
+REPEAT_OPS = [op for op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, getattr(sre_constants, "POSSESSIVE_REPEAT", None)) if op is not None]
+
+# returns the parsed tree of a regex, or None if it cannot be parsed. The regex is only compiled, never parsed by the script
+# otherwise, so any issue here is not fatal: callers treat a regex that cannot be parsed as one they know nothing about.
+def parse_regex(find: str, flags: int = 0):
+    try:
+        return sre_parse.parse(find, flags)
+    except Exception:
+        return None
+
+# returns the literal strings that every match of a parsed regex sequence must contain
+def get_required_literals(parsed) -> list[str]:
+    literals = []
+    current = ""
+    for op, av in parsed:
+        if op == sre_constants.LITERAL:
+            current += chr(av)
+            continue
+        if current:
+            literals.append(current)
+            current = ""
+        if op == sre_constants.SUBPATTERN:
+            group, add_flags, del_flags, sub_pattern = av
+            if not add_flags & re.IGNORECASE: # literals of case insensitive groups could match in any case
+                literals.extend(get_required_literals(sub_pattern))
+        elif op in REPEAT_OPS and av[0] >= 1: # only repeats that must happen at least once
+            literals.extend(get_required_literals(av[2]))
+        elif op == getattr(sre_constants, "ATOMIC_GROUP", None):
+            literals.extend(get_required_literals(av))
+    if current:
+        literals.append(current)
+    return literals
+
+# returns the longest literal string every match of the regex must contain, or None if there is none that can be found safely
+def get_required_literal(pattern: re.Pattern) -> str | None:
+    if pattern.flags & re.IGNORECASE:
+        return None
+    parsed = parse_regex(pattern.pattern, pattern.flags)
+    if parsed is None:
+        return None
+    literals = get_required_literals(parsed)
+    if not literals:
+        return None
+    return max(literals, key=len)[:MAX_LITERAL_LENGTH]
+
+# returns True if a parsed regex matches the same text when compiled as bytes (in utf-8 or a single byte encoding) as it does
+# on decoded text. ".", "\w"-like categories, negated or non-ASCII classes and word boundaries only ever see single bytes, and
+# a repeated non-ASCII character would only have its last byte repeated, so regex using them are not.
+def is_bytes_equivalent(parsed) -> bool:
+    for op, av in parsed:
+        if op in (sre_constants.ANY, sre_constants.NOT_LITERAL, sre_constants.CATEGORY):
+            return False
+        if op == sre_constants.IN:
+            for item_op, item_av in av:
+                if item_op in (sre_constants.NEGATE, sre_constants.CATEGORY):
+                    return False
+                if (item_op == sre_constants.LITERAL and item_av > 127) or (item_op == sre_constants.RANGE and item_av[1] > 127):
+                    return False
+        elif op == sre_constants.AT and av in (sre_constants.AT_BOUNDARY, sre_constants.AT_NON_BOUNDARY):
+            return False
+        elif op in REPEAT_OPS:
+            if len(av[2]) == 1 and av[2][0][0] == sre_constants.LITERAL and av[2][0][1] > 127:
+                return False
+            if not is_bytes_equivalent(av[2]):
+                return False
+        elif op == sre_constants.SUBPATTERN:
+            if not is_bytes_equivalent(av[3]):
+                return False
+        elif op == sre_constants.BRANCH:
+            if not all(is_bytes_equivalent(branch) for branch in av[1]):
+                return False
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if not is_bytes_equivalent(av[1]):
+                return False
+        elif op == sre_constants.GROUPREF_EXISTS:
+            if not all(is_bytes_equivalent(branch) for branch in av[1:] if branch is not None):
+                return False
+        elif op == getattr(sre_constants, "ATOMIC_GROUP", None):
+            if not is_bytes_equivalent(av):
+                return False
+    return True
+
+# categories of regex such as "\s" or "\W" that match newlines
+NEWLINE_CATEGORIES = (sre_constants.CATEGORY_SPACE, sre_constants.CATEGORY_NOT_DIGIT, sre_constants.CATEGORY_NOT_WORD, sre_constants.CATEGORY_LINEBREAK)
+
+# returns True if no match of a parsed regex (lookarounds included) can contain a newline or rely on "\A" and "\Z", or
+# on "^" and "$" without MULTILINE. Such a regex matches the same in a text split after its newlines as in the whole text,
+# provided it cannot match an empty string (which "$" could find at the end of each part).
+def is_line_local(parsed, flags: int) -> bool:
+    for op, av in parsed:
+        if op == sre_constants.LITERAL and av == ord("\n"):
+            return False
+        if op == sre_constants.NOT_LITERAL and av != ord("\n"):
+            return False
+        if op == sre_constants.ANY and flags & re.DOTALL:
+            return False
+        if op == sre_constants.IN:
+            for item_op, item_av in av:
+                if item_op == sre_constants.NEGATE or (item_op == sre_constants.CATEGORY and item_av in NEWLINE_CATEGORIES):
+                    return False
+                if (item_op == sre_constants.LITERAL and item_av == ord("\n")) or (item_op == sre_constants.RANGE and item_av[0] <= ord("\n") <= item_av[1]):
+                    return False
+        elif op == sre_constants.AT:
+            if av in (sre_constants.AT_BEGINNING_STRING, sre_constants.AT_END_STRING):
+                return False
+            if av in (sre_constants.AT_BEGINNING, sre_constants.AT_END) and not flags & re.MULTILINE:
+                return False
+        elif op in REPEAT_OPS:
+            if not is_line_local(av[2], flags):
+                return False
+        elif op == sre_constants.SUBPATTERN:
+            group, add_flags, del_flags, sub_pattern = av
+            if not is_line_local(sub_pattern, (flags | add_flags) & ~del_flags):
+                return False
+        elif op == sre_constants.BRANCH:
+            if not all(is_line_local(branch, flags) for branch in av[1]):
+                return False
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if not is_line_local(av[1], flags):
+                return False
+        elif op == sre_constants.GROUPREF_EXISTS:
+            if not all(is_line_local(branch, flags) for branch in av[1:] if branch is not None):
+                return False
+        elif op == getattr(sre_constants, "ATOMIC_GROUP", None):
+            if not is_line_local(av, flags):
+                return False
+    return True
+
+# returns True if a parsed regex uses "$" or can match a "\n" or "\r". Such a regex does not match the same on a file
+# with "\r\n" line endings read as bytes as it does on the same file read with universal newlines.
+def is_newline_sensitive(parsed) -> bool:
+    for op, av in parsed:
+        if op == sre_constants.LITERAL and av in (ord("\n"), ord("\r")):
+            return True
+        if op == sre_constants.AT and av == sre_constants.AT_END:
+            return True
+        if op == sre_constants.IN:
+            for item_op, item_av in av:
+                if item_op == sre_constants.LITERAL and item_av in (ord("\n"), ord("\r")):
+                    return True
+                if item_op == sre_constants.RANGE and item_av[0] <= ord("\r") and item_av[1] >= ord("\n"):
+                    return True
+        elif op in REPEAT_OPS:
+            if is_newline_sensitive(av[2]):
+                return True
+        elif op == sre_constants.SUBPATTERN:
+            if is_newline_sensitive(av[3]):
+                return True
+        elif op == sre_constants.BRANCH:
+            if any(is_newline_sensitive(branch) for branch in av[1]):
+                return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if is_newline_sensitive(av[1]):
+                return True
+        elif op == sre_constants.GROUPREF_EXISTS:
+            if any(is_newline_sensitive(branch) for branch in av[1:] if branch is not None):
+                return True
+        elif op == getattr(sre_constants, "ATOMIC_GROUP", None):
+            if is_newline_sensitive(av):
+                return True
+    return False
+
+# checks whether text in the provided encoding can be searched as bytes, ASCII characters (and so all regex syntax) being single bytes
+def is_ascii_compatible(encoding: str) -> bool:
+    try:
+        ascii_chars = "".join(chr(i) for i in range(128))
+        return ascii_chars.encode(encoding) == ascii_chars.encode("ascii") and codecs.lookup(encoding).name not in ("utf-7",)
+    except (LookupError, UnicodeError):
+        return False
+
+# checks whether the rules give the same results on bytes in the provided encoding as on decoded text, for regex that
+# is_bytes_equivalent(): only in utf-8 and in encodings where every character is a single byte
+def is_bytes_native_encoding(encoding: str) -> bool:
+    try:
+        if codecs.lookup(encoding).name == "utf-8":
+            return True
+        return is_ascii_compatible(encoding) and len(bytes(range(256)).decode(encoding, errors="replace")) == 256
+    except LookupError:
+        return False
+
+# Each CompiledRule holds the precompiled pattern of one ReplacementStr, along with its position in the strings file
+# and the literal string that every match of it contains (if any).
+# If an encoding is provided, the pattern, replacement and literal are bytes in that encoding, for searching undecoded files.
+class CompiledRule():
+    index: int
+    find: str
+    replace: str | bytes
+    pattern: re.Pattern
+    literal: str | bytes | None
+
+    def __init__(self, index: int, string: ReplacementStr, flags: int = 0, encoding: str = None):
+        self.index = index
+        self.find = string.find
+        self.replace = string.replace
+        self.pattern = re.compile(string.find, flags)
+        self.literal = get_required_literal(self.pattern)
+        if encoding is not None:
+            self.replace = string.replace.encode(encoding)
+            self.pattern = re.compile(string.find.encode(encoding), flags)
+            if self.literal is not None:
+                self.literal = self.literal.encode(encoding)
+
+    # returns the replacement of a match of the rule
+    def expand(self, match: re.Match) -> str | bytes:
+        return match.expand(self.replace)
+
+    # returns the rule a match was made by, which is the rule itself (see LiteralGroup.source())
+    def source(self, match: re.Match) -> "CompiledRule":
+        return self
+
+# returns the text every match of a regex is, if it has no regex syntax (once escapes are taken into account), None otherwise
+def get_literal_text(find: str, flags: int = 0) -> str | None:
+    parsed = parse_regex(find, flags)
+    if parsed is None:
+        return None
+    if flags & re.IGNORECASE or parsed.state.flags & re.IGNORECASE or not len(parsed):
+        return None
+    if any(op != sre_constants.LITERAL for op, av in parsed):
+        return None
+    return "".join(chr(av) for op, av in parsed)
+
+# returns a regex matching the longest literal of the trie starting at the current position
+def trie_to_regex(node: dict) -> str:
+    branches = [re.escape(char) + trie_to_regex(node[char]) for char in sorted(char for char in node if char is not None)]
+    if not branches:
+        return ""
+    if None in node: # a literal ends here, longer ones are optional
+        return "(?:" + "|".join(branches) + ")?"
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+# A LiteralGroup replaces the matches of many consecutive literal rules (see get_literal_text()) with a single scan, for
+# LITERAL_GROUPS. The literals are merged into a trie turned into one regex, as in the LiteralIndex, and each match is
+# replaced through a lookup of the text matched. At each position the longest literal starting there is replaced (the first
+# rule winning for duplicated literals), and replacements are never scanned again by the rules of the group.
+# It is used in place of a CompiledRule, its index being the one of its first rule.
+class LiteralGroup():
+    rules: list[CompiledRule]
+    index: int
+    find: str
+    literal: str | bytes
+    replacements: dict[str | bytes, tuple[CompiledRule, str | bytes]]
+    pattern: re.Pattern
+    hits: list[CompiledRule]
+
+    # rules holds each rule along with its literal text, always as text
+    def __init__(self, rules: list[tuple[CompiledRule, str]], encoding: str = None):
+        self.rules = [rule for rule, text in rules]
+        self.index = self.rules[0].index
+        self.find = self.rules[0].find
+        self.literal = self.rules[0].literal
+        self.replacements = {}
+        trie = {}
+        for rule, text in rules:
+            key = text if encoding is None else text.encode(encoding)
+            if key in self.replacements: # later rules could only match text brought in by replacements
+                continue
+            self.replacements[key] = (rule, rule.pattern.sub(rule.replace, key)) # every match is the same, and so is its replacement
+            node = trie
+            for char in (key.decode("latin-1") if encoding is not None else key): # latin-1 maps every byte to one character
+                node = node.setdefault(char, {})
+            node[None] = {}
+        regex = trie_to_regex(trie)
+        self.pattern = re.compile(regex if encoding is None else regex.encode("latin-1"))
+        self.hits = []
+
+    # returns the replacement of the literal matched
+    def expand(self, match: re.Match) -> str | bytes:
+        return self.replacements[match.group(0)][1]
+
+    # returns the rule of the group whose literal was matched
+    def source(self, match: re.Match) -> CompiledRule:
+        return self.replacements[match.group(0)][0]
+
+    # the replacement function given to subn(), which keeps the rules that matched in hits (see take_hits())
+    def replace(self, match: re.Match) -> str | bytes:
+        rule, new = self.replacements[match.group(0)]
+        self.hits.append(rule)
+        return new
+
+    # returns the rules that matched since the last call, in order, along with their number of matches
+    def take_hits(self) -> list[tuple[CompiledRule, int]]:
+        counts = {}
+        for rule in self.hits:
+            counts[rule] = counts.get(rule, 0) + 1
+        self.hits = []
+        return sorted(counts.items(), key=lambda item: item[0].index)
+
+# merges each run of two or more consecutive literal rules into a LiteralGroup, returning the stages the rules are applied in
+def group_literal_rules(rules: list[CompiledRule], flags: int = 0, encoding: str = None) -> list[CompiledRule | LiteralGroup]:
+    stages = []
+    run = []
+    for rule in rules + [None]:
+        text = get_literal_text(rule.find, flags) if rule is not None else None
+        if text is not None:
+            run.append((rule, text))
+            continue
+        if len(run) >= 2:
+            try:
+                stages.append(LiteralGroup(run, encoding))
+            except (re.error, RecursionError, OverflowError): # the rules are then applied one by one
+                stages.extend(rule for rule, text in run)
+        else:
+            stages.extend(rule for rule, text in run)
+        run = []
+        if rule is not None:
+            stages.append(rule)
+    return stages
+
+# The LiteralIndex finds which of many literal strings appear in a text with a single scan. Literals are merged into a trie
+# which is turned into one regex, so at each position of the text only the branches matching it are followed, instead of
+# trying every literal one after another. At each position the longest literal is reported, shorter literals starting at
+# the same position being its prefixes. Literals can also be bytes, for searching bytes or memory-mapped files.
+class LiteralIndex():
+    pattern: re.Pattern
+    prefixes: dict[str | bytes, list[str | bytes]]
+
+    def __init__(self, literals: list[str | bytes]):
+        is_bytes = isinstance(literals[0], bytes)
+        trie = {}
+        for literal in literals:
+            node = trie
+            for char in (literal.decode("latin-1") if is_bytes else literal): # latin-1 maps every byte to one character
+                node = node.setdefault(char, {})
+            node[None] = {}
+        regex = "(?=(" + trie_to_regex(trie) + "))"
+        self.pattern = re.compile(regex.encode("latin-1") if is_bytes else regex, re.DOTALL)
+        literal_set = set(literals)
+        self.prefixes = {literal: [literal[:i] for i in range(1, len(literal) + 1) if literal[:i] in literal_set] for literal in literal_set}
+
+    def find(self, text: str | bytes) -> set[str | bytes]:
+        found = set()
+        for match in self.pattern.finditer(text):
+            longest = match.group(1)
+            if longest not in found:
+                found.update(self.prefixes[longest])
+        return found
+
+# Patterns using backreferences, conditional group references, named groups or global inline flags cannot be safely merged
+# into one alternation, since the group numbers and flags they rely on change once they are wrapped in a group of their own
+UNMERGEABLE_REGEX = re.compile(r"\\[1-9]|\\g<|\(\?\(|\(\?P|\(\?[aiLmsux-]+\)")
+
+# The RuleSet compiles every valid ReplacementStr once up front and applies them in order.
+# Rules are indexed by the literal each of their matches contains, so the rules that can possibly match a file, line or tag
+# are found with one scan of it (see candidates()). Rules without such a literal are combined into one pattern instead
+# (one named group per rule), so a single scan tells whether any of them matches.
+# With an encoding, rules are compiled as bytes patterns; ValueError is raised if one of them cannot be.
+# With group_literals, consecutive literal rules are applied as LiteralGroups, stages holding the rules and groups in order.
+# When profiling (see set_profile()), the time, attempts and hits of each rule are recorded in stats.
+class RuleSet():
+    strings: list[ReplacementStr]
+    flags: int
+    encoding: str | None
+    rules: list[CompiledRule]
+    group_literals: bool
+    stages: list[CompiledRule | LiteralGroup]
+    literal_index: LiteralIndex | None
+    rules_by_literal: dict[str | bytes, list[CompiledRule | LiteralGroup]]
+    max_literal_length: int
+    unindexed: list[CompiledRule | LiteralGroup]
+    combined: re.Pattern | None
+    unmerged: list[CompiledRule | LiteralGroup]
+    bytes_rule_sets: dict[str, "RuleSet"]
+    bytes_equivalent: bool | None
+    newline_sensitive: bool | None
+    line_local: bool | None
+    stats: dict[int, list] | None
+
+    def __init__(self, strings: list[ReplacementStr], flags: int = 0, encoding: str = None, group_literals: bool = False):
+        self.strings = strings
+        self.flags = flags
+        self.encoding = encoding
+        self.group_literals = group_literals
+        self.bytes_rule_sets = {}
+        self.bytes_equivalent = None # only checked when first needed
+        self.newline_sensitive = None
+        self.line_local = None
+        self.stats = None
+        self.rules = []
+        for index, string in enumerate(strings):
+            if valid_regex(string.find): # invalid regex are reported to the user beforehand and left out here
+                try:
+                    self.rules.append(CompiledRule(index, string, flags, encoding))
+                except (re.error, UnicodeError) as e:
+                    raise ValueError(f"The regex on line {index + 1} cannot be used on {encoding} bytes: {e}")
+        self.stages = group_literal_rules(self.rules, flags, encoding) if group_literals else self.rules
+        self.rules_by_literal = {}
+        self.unindexed = [] # rules without a required literal are candidates for every text
+        for stage in self.stages:
+            for rule in (stage.rules if isinstance(stage, LiteralGroup) else [stage]): # a group is a candidate if any of its literals is found
+                if rule.literal:
+                    stages = self.rules_by_literal.setdefault(rule.literal, [])
+                    if not stages or stages[-1] is not stage:
+                        stages.append(stage)
+                else:
+                    self.unindexed.append(stage)
+        # in characters, or in bytes for a rule set compiled as bytes, where a literal can be several times longer
+        self.max_literal_length = max((len(literal) for literal in self.rules_by_literal), default=0)
+        self.literal_index = None
+        if self.rules_by_literal:
+            try:
+                self.literal_index = LiteralIndex(list(self.rules_by_literal))
+            except (re.error, RecursionError, OverflowError): # every rule is then a candidate for every text
+                self.unindexed = self.stages
+                self.rules_by_literal = {}
+        # groups are never combined, since only their own pattern matches all their literals
+        mergeable = [rule for rule in self.unindexed if isinstance(rule, CompiledRule) and not UNMERGEABLE_REGEX.search(rule.find)]
+        self.unmerged = [rule for rule in self.unindexed if not isinstance(rule, CompiledRule) or UNMERGEABLE_REGEX.search(rule.find)]
+        self.combined = None
+        if mergeable:
+            try:
+                combined = "|".join(f"(?P<r{rule.index}>{rule.find})" for rule in mergeable)
+                self.combined = re.compile(combined if encoding is None else combined.encode(encoding), flags)
+            except (re.error, RecursionError, OverflowError): # fall back to scanning each rule on its own
+                self.unmerged = self.unindexed
+
+    # returns the same rules compiled as bytes patterns in the provided encoding, compiling them only once
+    def for_bytes(self, encoding: str) -> "RuleSet":
+        if encoding not in self.bytes_rule_sets:
+            self.bytes_rule_sets[encoding] = RuleSet(self.strings, self.flags, encoding, self.group_literals)
+            self.bytes_rule_sets[encoding].stats = self.stats
+        return self.bytes_rule_sets[encoding]
+
+    # returns the rules compiled as bytes in the provided encoding if they give the same results on bytes as on decoded text
+    # (see is_bytes_equivalent() and is_bytes_native_encoding()), None otherwise. If the text would be read with universal
+    # newlines, its undecoded contents (bytes or mmap) must be provided: rules using "$", "\n" or "\r" do not give the same
+    # results once they contain a "\r" (see is_newline_sensitive()).
+    def get_bytes_rule_set(self, encoding: str, contents=None) -> "RuleSet | None":
+        if not is_bytes_native_encoding(encoding):
+            return None
+        if self.bytes_equivalent is None:
+            parsed = [parse_regex(rule.find, rule.pattern.flags) for rule in self.rules]
+            if any(rule_parsed is None for rule_parsed in parsed):
+                self.bytes_equivalent = False
+            else:
+                self.bytes_equivalent = all(not rule.pattern.flags & re.IGNORECASE and is_bytes_equivalent(rule_parsed) for rule, rule_parsed in zip(self.rules, parsed))
+                self.newline_sensitive = any(is_newline_sensitive(rule_parsed) for rule_parsed in parsed)
+        if not self.bytes_equivalent:
+            return None
+        if contents is not None and self.newline_sensitive and contents.find(b"\r") != -1:
+            return None
+        try:
+            return self.for_bytes(encoding)
+        except ValueError:
+            return None
+
+    # returns True if every rule is line local (see is_line_local()), so the rules can be applied to a text one part at a
+    # time, each part ending with a newline
+    def is_line_local(self) -> bool:
+        if self.line_local is None:
+            parsed = [parse_regex(rule.find, rule.pattern.flags) for rule in self.rules]
+            self.line_local = all(rule_parsed is not None and rule_parsed.getwidth()[0] > 0 and is_line_local(rule_parsed, rule.pattern.flags) for rule, rule_parsed in zip(self.rules, parsed))
+        return self.line_local
+
+    # makes the rule set (and its bytes rule sets) record the [seconds, attempts, hits] of each rule by index in stats,
+    # or stop recording if stats is None. A LiteralGroup is timed as a whole, by the (first, last) indexes of its rules.
+    def set_profile(self, stats: dict[int | tuple[int, int], list] | None):
+        self.stats = stats
+        for bytes_rule_set in self.bytes_rule_sets.values():
+            bytes_rule_set.stats = stats
+
+    # records an attempt of a rule which started at started and made hits changes. For a LiteralGroup, sources are the
+    # (rule, hits) of each of its rules that matched, which are credited their own hits besides those of the group.
+    def record(self, rule: CompiledRule | LiteralGroup, started: float, hits: int, attempts: int = 1, sources: list[tuple[CompiledRule, int]] = None):
+        key = (rule.index, rule.rules[-1].index) if isinstance(rule, LiteralGroup) else rule.index
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = self.stats[key] = [0.0, 0, 0]
+        stat[0] += time.perf_counter() - started
+        stat[1] += attempts
+        stat[2] += hits
+        if isinstance(rule, LiteralGroup):
+            for source, source_hits in sources or []:
+                self.stats.setdefault(source.index, [0.0, 0, 0])[2] += source_hits
+
+    # returns, in order, the rules that can possibly match the text (or anything within it), using a single scan of it
+    def candidates(self, text: str | bytes) -> list[CompiledRule | LiteralGroup]:
+        if self.literal_index is None:
+            return list(self.unindexed)
+        found = list(self.unindexed)
+        for literal in self.literal_index.find(text):
+            found.extend(self.rules_by_literal[literal])
+        if self.stages is not self.rules: # a group is found once for each of its literals in the text
+            found = list({rule.index: rule for rule in found}.values())
+        found.sort(key=lambda rule: rule.index)
+        return found
+
+    # returns True if at least one of the rules without a required literal matches the text
+    def unindexed_can_match(self, text: str) -> bool:
+        if self.combined is not None and self.combined.search(text):
+            return True
+        for rule in self.unmerged:
+            if rule.pattern.search(text):
+                return True
+        return False
+
+    # applies every rule to the text in order, each rule working on the output of the previous one.
+    # candidates (from candidates() on the file containing the text) can be provided to save scanning the text for literals
+    # when there are only a few of them. Later rules whose literal is brought in by a replacement are tried as well.
+    # Returns the new text along with the list of (rule, text before, text after) for each rule that made a change.
+    def apply(self, text: str, candidates: list[CompiledRule] = None) -> tuple[str, list[tuple[CompiledRule, str, str]]]:
+        changes = []
+        if candidates is None or len(candidates) > CANDIDATES_WITHOUT_PREFILTER:
+            candidates = self.candidates(text)
+            if self.unindexed and candidates and not self.unindexed_can_match(text):
+                candidates = [rule for rule in candidates if rule.literal]
+        rules = candidates
+        i = 0
+        while i < len(rules):
+            rule = rules[i]
+            if self.stats is None:
+                new_text, count = rule.pattern.subn(rule.replace, text)
+                sources = rule.take_hits() if isinstance(rule, LiteralGroup) else None
+            else:
+                started = time.perf_counter()
+                new_text, count = rule.pattern.subn(rule.replace, text)
+                sources = rule.take_hits() if isinstance(rule, LiteralGroup) else None
+                self.record(rule, started, count, sources=sources)
+            if count:
+                if sources is not None: # each rule of the group that matched made a change
+                    changes.extend((source, text, new_text) for source, hits in sources)
+                else:
+                    changes.append((rule, text, new_text))
+                text = new_text
+                rules = rules[:i + 1] + [later for later in self.candidates(text) if later.index > rule.index]
+            i += 1
+        return text, changes
+
+# up to this many candidate rules of a file are tried directly on each of its lines or tags, without scanning them first
+CANDIDATES_WITHOUT_PREFILTER = 4
+
+# returns the rules, after the one at after_index, whose literal may have been brought in by replacements.
+# Only the text around each replaced part (spans, in the new text) is scanned, joined together: joining them can only add candidates.
+def get_candidates_near(rule_set: RuleSet, text, spans: list[tuple[int, int]], after_index: int) -> list[CompiledRule]:
+    margin = get_window_margin(rule_set)
+    windows = [text[max(0, start - margin):end + margin] for start, end in spans]
+    joined = (b"\n" if rule_set.encoding is not None else "\n").join(windows)
+    return [rule for rule in rule_set.candidates(joined) if rule.index > after_index]
+
+# the number of characters (bytes for a rule set compiled as bytes) around a replacement scanned by get_candidates_near()
+def get_window_margin(rule_set: RuleSet) -> int:
+    return max(rule_set.max_literal_length - 1, 0)
+
+# adds the span of a replacement to the spans given to get_candidates_near(), merging it into the previous one when the
+# text scanned around both would overlap, so that many close replacements only keep a few spans
+def add_span(rule_set: RuleSet, spans: list[tuple[int, int]], start: int, end: int):
+    if spans and start - spans[-1][1] <= 2 * get_window_margin(rule_set):
+        spans[-1] = (spans[-1][0], end)
+    else:
+        spans.append((start, end))
+
+# merges newly found candidates into the rules still to be tried, keeping the order of the strings file
+def merge_candidates(rules: list[CompiledRule], new_rules: list[CompiledRule]) -> list[CompiledRule]:
+    merged = {rule.index: rule for rule in rules}
+    for rule in new_rules:
+        merged[rule.index] = rule
+    return [merged[index] for index in sorted(merged)]
+
 # Class will contain all settings imported from the config file
 class SETTINGS:
     DELIMITER: str = "||||"
@@ -36,6 +624,26 @@ class SETTINGS:
     STRINGS_FILE_NAME: str = "regexp.dat"
     BANNED_FILE_NAMES: list[str] = ["readme.txt","regexp.dat","change-text.log"]
     SKIP_FILES_WITH_UNIDENTIFIED_TAGS: bool = True
+    WORKERS: int = 1
+    MAX_DEPTH: int = 0
+    INCLUDE_GLOBS: list[str] = []
+    EXCLUDE_GLOBS: list[str] = []
+    PLAINTEXT_MODE: str = "LINES"
+    HYPERTEXT_ENGINE: str = "SOUP"
+    MMAP_MIN_SIZE: int = 64 * 1024 * 1024
+    BYTES_MODE: bool = False
+    LITERAL_GROUPS: bool = False
+    MANIFEST_FILE_NAME: str = ""
+    JOURNAL_FILE_NAME: str = ""
+    SHARD: tuple[int, int] | None = None
+    PROFILE_FILE_NAME: str = ""
+    SCAN_MODE: str = "OFF"
+    LOG_FORMAT: str = "TEXT"
+    LOG_VERBOSITY: str = "CHANGES"
+    LOG_SNIPPET_LENGTH: int = 200
+    WATCH_ENGINE: str = "AUTO"
+    WATCH_DELAY: float = 1.0
+    WATCH_POLL_INTERVAL: float = 2.0
 
 # Exception handles when config file has an invalid setting
 class InvalidSettingException(Exception):
@@ -75,409 +683,2427 @@ class EmptyStringsFileException(StringsFileException):
         self.message = message
         super().__init__(self.message)
 
-print("""
-        Warnings:
-        - Please read the "readme.txt" file before using the script.
-        - No lines can contain "\\n" in the config file.
-        - You can either run the script for hypertext files or non-hypertext files - not both at the same time
-        ----------------------------------------------------
-        """)
+# FileResult holds the outcome of processing a single file, so it can be sent back from a worker process.
+# logs holds the text log entries of the file, rule_hits the number of changes made by each rule (by index) and snippets the
+# capped before/after texts of the first changes, used by JSONL logs. timings holds the seconds spent in each stage
+# (read, parse, match, serialize, write) of processing the file, and rule_stats the [seconds, attempts, hits] of each rule
+# by index (or of each LiteralGroup, see RuleSet.set_profile()) when profiling.
+class FileResult():
+    changes: int
+    skipped: bool
+    logs: list[str]
+    rule_hits: dict[int, int]
+    snippets: list[dict]
+    skip_reason: str | None
+    manifest_entry: dict | None
+    timings: dict[str, float]
+    rule_stats: dict[int | tuple[int, int], list]
+
+    def __init__(self, changes: int = 0, skipped: bool = False, logs: list[str] = None):
+        self.changes = changes
+        self.skipped = skipped
+        self.logs = logs if logs is not None else []
+        self.rule_hits = {}
+        self.snippets = []
+        self.skip_reason = None
+        self.manifest_entry = None
+        self.timings = {}
+        self.rule_stats = {}
+
+    # adds the time since started to a stage, returning the current time so the next stage can start from it
+    def add_time(self, stage: str, started: float) -> float:
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - started
+        return now
+
+    # marks the file as skipped, the reason being logged and printed to CLI as well since it is important for the user to
+    # know and likely rare for most use cases
+    def skip(self, file: str, reason: str):
+        self.skipped = True
+        self.skip_reason = reason
+        info = f"{file} SKIPPED ({datetime.now()}): {reason}, and has been skipped due to this reason\n"
+        print(info)
+        self.logs.append(info)
+
+# up to this many before/after snippets are kept for each file in JSONL logs
+LOG_SNIPPETS_PER_FILE = 20
+
+# A ChangeLog collects the changes made in a file by an engine. Changes are only counted per rule, unless LOG_VERBOSITY is
+# CHANGES: then each change is also kept as a text log entry (TEXT logs) or as a capped snippet (JSONL logs).
+# Engines that may still skip the file once changes were made only record them in the result once it is known not to be.
+class ChangeLog():
+    file: str
+    encoding: str
+    count: int
+    rule_hits: dict[int, int]
+    entries: list[str]
+    snippets: list[dict]
+
+    def __init__(self, file: str, encoding: str = None):
+        self.file = file
+        self.encoding = encoding or SETTINGS.ENCODING
+        self.count = 0
+        self.rule_hits = {}
+        self.entries = []
+        self.snippets = []
+
+    # old and new can be bytes (from the mmap engine or BYTES_MODE), they are then only decoded if they are logged
+    def add(self, rule, old: str | bytes, new: str | bytes):
+        self.count += 1
+        self.rule_hits[rule.index] = self.rule_hits.get(rule.index, 0) + 1
+        if SETTINGS.LOG_VERBOSITY != "CHANGES":
+            return
+        if SETTINGS.LOG_FORMAT == "JSONL" and len(self.snippets) >= LOG_SNIPPETS_PER_FILE:
+            return
+        if isinstance(old, bytes):
+            old = old.decode(self.encoding, errors="replace")
+            new = new.decode(self.encoding, errors="replace")
+        old = old.strip("\n")
+        new = new.strip("\n")
+        if SETTINGS.LOG_FORMAT == "JSONL":
+            length = SETTINGS.LOG_SNIPPET_LENGTH
+            self.snippets.append({"rule": rule.index + 1, "old": old[:length], "new": new[:length]})
+        else:
+            self.entries.append(f'{self.file} CHANGE ({datetime.now()}): \"{old}\" --------> \"{new}\"\n')
+
+    def __bool__(self) -> bool:
+        return self.count > 0
+
+    # adds the changes to the result of the file
+    def record(self, result: FileResult):
+        result.changes += self.count
+        for index, hits in self.rule_hits.items():
+            result.rule_hits[index] = result.rule_hits.get(index, 0) + hits
+        result.logs.extend(self.entries)
+        result.snippets.extend(self.snippets)
+
+# returns a fingerprint of the rules and of every setting that affects how a file is changed
+def get_fingerprint(strings: list[ReplacementStr]) -> str:
+    data = {
+        "rules": [[string.find, string.replace] for string in strings],
+        "HYPERTEXT_SUPPORT": SETTINGS.HYPERTEXT_SUPPORT,
+        "BANNED_TAGS": SETTINGS.BANNED_TAGS,
+        "ENCODING": SETTINGS.ENCODING,
+        "SKIP_FILES_WITH_UNIDENTIFIED_TAGS": SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS,
+        "OVERWRITE_FILES": SETTINGS.OVERWRITE_FILES,
+        "NEW_FILE_NAMES_SUFFIX": SETTINGS.NEW_FILE_NAMES_SUFFIX,
+        "PLAINTEXT_MODE": SETTINGS.PLAINTEXT_MODE,
+        "HYPERTEXT_ENGINE": SETTINGS.HYPERTEXT_ENGINE,
+        "BYTES_MODE": SETTINGS.BYTES_MODE,
+        "LITERAL_GROUPS": SETTINGS.LITERAL_GROUPS,
+    }
+    return hashlib.sha256(json.dumps(data).encode("utf-8")).hexdigest()
+
+# returns the hash of the contents of a file
+def get_file_hash(file_name: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+# returns what the manifest stores about a file processed with the provided fingerprint
+def get_manifest_entry(file_name: str, fingerprint: str, status: str) -> dict:
+    stat = os.stat(file_name)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": get_file_hash(file_name), "fingerprint": fingerprint, "status": status}
+
+# The Manifest remembers the size, modification time and content hash of every file processed in previous runs,
+# along with the fingerprint of the rules and settings used, so files that have not changed since can be skipped unopened
+class Manifest():
+    file_name: str
+    entries: dict[str, dict]
+    files_up_to_date: int
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.entries = {}
+        self.files_up_to_date = 0
+        if os.path.exists(file_name):
+            try:
+                with open(file_name, "r", encoding="utf-8") as manifest_file:
+                    self.entries = json.load(manifest_file)["files"]
+            except (OSError, ValueError, KeyError, TypeError):
+                print(f"Warning! The manifest {file_name} could not be read, every file will be processed.")
+
+    # checks whether a file is unchanged since it was last processed with the same fingerprint
+    def is_up_to_date(self, file_name: str, fingerprint: str) -> bool:
+        entry = self.entries.get(file_name)
+        if entry is None or entry.get("fingerprint") != fingerprint:
+            return False
+        try:
+            stat = os.stat(file_name)
+            if stat.st_size != entry["size"]:
+                return False
+            if stat.st_mtime_ns == entry["mtime_ns"]:
+                return True
+            # the modification time changed, the file is only opened to check whether its contents did too
+            if get_file_hash(file_name) == entry["hash"]:
+                entry["mtime_ns"] = stat.st_mtime_ns
+                return True
+        except (OSError, KeyError):
+            pass
+        return False
+
+    # leaves out the files (relative to the directory being processed) which are up to date, counting them
+    def filter_up_to_date(self, files, fingerprint: str):
+        for file in files:
+            if self.is_up_to_date(get_file_path(file), fingerprint):
+                self.files_up_to_date += 1
+            else:
+                yield file
+
+    def record(self, file_name: str, entry: dict):
+        self.entries[file_name] = entry
+
+    # the manifest is written to a temporary file first, so an interrupted run never leaves it half written
+    def save(self):
+        temp_file_name = self.file_name + ".tmp"
+        with open(temp_file_name, "w", encoding="utf-8") as manifest_file:
+            json.dump({"files": self.entries}, manifest_file)
+        os.replace(temp_file_name, self.file_name)
+
+# returns the directory that files are searched in
+def get_files_dir() -> str:
+    if not SETTINGS.PROCESS_FILES_IN_CURRENT_DIR:
+        return SETTINGS.FILES_CUSTOM_DIR
+    return SCRIPT_DIR
+
+# returns the full path of a file found in the directory being processed, file being relative to that directory
+def get_file_path(file: str) -> str:
+    return os.path.join(get_files_dir(), file)
+
+# returns the path of the file containing the changes made to file_name (e.g. "page.html" -> "page_new.html")
+def get_new_file_path(file_name: str) -> str:
+    root, ext = os.path.splitext(file_name)
+    return f'{root}{SETTINGS.NEW_FILE_NAMES_SUFFIX}{ext}'
+
+# returns the (index, count) of a shard written as "i/N" (from 1/N to N/N), None if it is not valid
+def parse_shard(value: str) -> tuple[int, int] | None:
+    index, separator, count = value.partition("/")
+    if not separator or not index.isdigit() or not count.isdigit() or not 1 <= int(index) <= int(count):
+        return None
+    return int(index), int(count)
+
+# checks whether a file (relative to the directory being processed) belongs to a shard. Files are split by a hash of their
+# path, so every machine splits the same files the same way without having to agree on anything else.
+def is_in_shard(file: str, shard: tuple[int, int]) -> bool:
+    index, count = shard
+    digest = hashlib.sha256(file.encode("utf-8", "surrogateescape")).digest()
+    return int.from_bytes(digest[:8], "big") % count == index - 1
+
+# returns the name of a file written by a shard (SHARD by default) of a run, so shards running at the same time never write
+# to the same file (e.g. "change-text.log" -> "change-text.shard-2-of-4.log"). The name is returned as is for runs which are
+# not sharded.
+def get_shard_file_name(file_name: str, shard: tuple[int, int] | None = None) -> str:
+    shard = shard or SETTINGS.SHARD
+    if shard is None or not file_name:
+        return file_name
+    root, ext = os.path.splitext(file_name)
+    return f"{root}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+# opens a file (by name or descriptor) to write text to, in binary mode if text is bytes (already encoded)
+def open_for_writing(file, text: str | bytes, newline: str = None, encoding: str = None):
+    if isinstance(text, bytes):
+        return open(file, "wb")
+    return open(file, "w", encoding=encoding or SETTINGS.ENCODING, newline=newline)
+
+# replaces the contents of file_name by writing a temporary file in the same directory, then moving it over the original
+# with a single os.replace, so the original is never left half written. The permissions of the original are kept, or the
+# ones of mode_file_name if provided (for a file written in place of another one). A symlink is followed, the file it
+# points to being replaced.
+def replace_file_contents(file_name: str, text: str | bytes, newline: str = None, encoding: str = None, mode_file_name: str = None):
+    file_name = os.path.realpath(file_name)
+    dir_name, base_name = os.path.split(file_name)
+    fd, temp_file_name = tempfile.mkstemp(prefix=f".{base_name}.", suffix=".tmp", dir=dir_name or None)
+    try:
+        with open_for_writing(fd, text, newline, encoding) as temp_file:
+            temp_file.write(text)
+        shutil.copymode(mode_file_name or file_name, temp_file_name)
+        os.replace(temp_file_name, file_name)
+    except BaseException:
+        if os.path.exists(temp_file_name):
+            os.remove(temp_file_name)
+        raise
+
+# writes the changed contents of file_name, either over it (OVERWRITE_FILES) or to a new file next to it. text is written
+# as is if it is bytes, or encoded in encoding (ENCODING by default) otherwise.
+# newline is passed to open(), "" keeping line endings exactly as they are in text. Returns the name of the file written.
+def write_changed_file(file_name: str, text: str | bytes, newline: str = None, encoding: str = None) -> str:
+    if SETTINGS.OVERWRITE_FILES:
+        replace_file_contents(file_name, text, newline, encoding)
+        return file_name
+    new_file_name = get_new_file_path(file_name) # also written through a temporary file, so it is never left half written
+    replace_file_contents(new_file_name, text, newline, encoding, mode_file_name=file_name)
+    return new_file_name
+
+# moves a temporary file holding the changed contents of file_name either over it (OVERWRITE_FILES, keeping its permissions)
+# or to a new file next to it. Returns the name of the file written.
+def move_changed_file(file_name: str, temp_file_name: str) -> str:
+    if SETTINGS.OVERWRITE_FILES:
+        shutil.copymode(file_name, temp_file_name)
+        os.replace(temp_file_name, os.path.realpath(file_name)) # through a symlink, as replace_file_contents() does
+        return file_name
+    new_file_name = get_new_file_path(file_name)
+    shutil.copymode(file_name, temp_file_name)
+    os.replace(temp_file_name, os.path.realpath(new_file_name))
+    return new_file_name
+
+# creates the temporary file the changed contents of file_name are written to before move_changed_file(), next to the
+# file it will become so it can be moved there: the file a symlink points to, or the new file if files are not overwritten
+def make_temp_file(file_name: str) -> tuple[int, str]:
+    dir_name, base_name = os.path.split(os.path.realpath(file_name if SETTINGS.OVERWRITE_FILES else get_new_file_path(file_name)))
+    return tempfile.mkstemp(prefix=f".{base_name}.", suffix=".tmp", dir=dir_name)
+
+# up to this many bytes at the start of a file are used to detect its encoding
+ENCODING_SNIFF_SIZE = 1024
+# byte order marks and the encodings they stand for, the UTF-32 ones coming first since they start like the UTF-16 ones
+BYTE_ORDER_MARKS = [(codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")]
+XML_DECLARATION_ENCODING_REGEX = re.compile(rb"""<\?xml[^>]*?\sencoding\s*=\s*["']([A-Za-z0-9._:-]+)["']""")
+META_CHARSET_REGEX = re.compile(rb"""<meta[^>]*?charset\s*=\s*["']?\s*([A-Za-z0-9._:-]+)""", re.IGNORECASE)
+
+# detects the encoding of a file from its first bytes: its byte order mark, then (for hypertext files) its XML declaration or
+# "<meta charset>" tag. ENCODING is used if none is found or if the one found is unknown.
+def detect_encoding(head: bytes) -> str:
+    for byte_order_mark, encoding in BYTE_ORDER_MARKS:
+        if head.startswith(byte_order_mark):
+            return encoding
+    if SETTINGS.HYPERTEXT_SUPPORT:
+        match = XML_DECLARATION_ENCODING_REGEX.match(head) or META_CHARSET_REGEX.search(head)
+        if match:
+            encoding = match.group(1).decode("ascii") # kept as declared, so it is declared the same way when written back
+            try:
+                if codecs.lookup(encoding).name.startswith(("utf-16", "utf-32")): # a declaration readable as ASCII cannot be in these
+                    return "utf-8"
+            except LookupError:
+                return SETTINGS.ENCODING
+            return encoding
+    return SETTINGS.ENCODING
+
+# returns the encoding of a file: detected from its first bytes with BYTES_MODE, ENCODING otherwise
+def get_file_encoding(file_name: str) -> str:
+    if not SETTINGS.BYTES_MODE:
+        return SETTINGS.ENCODING
+    with open(file_name, "rb") as f:
+        return detect_encoding(f.read(ENCODING_SNIFF_SIZE))
+
+# reads a text file in its encoding (see get_file_encoding()), returning its contents along with the encoding.
+# UnicodeDecodeError is raised if it cannot be decoded.
+def read_text_file(file_name: str, newline: str = None) -> tuple[str, str]:
+    encoding = get_file_encoding(file_name)
+    with open(file_name, "r", encoding=encoding, newline=newline) as original:
+        return original.read(), encoding
+
+# reads a file to apply the rules to, returning (contents, rule set, encoding, byte order mark). With BYTES_MODE, if the
+# encoding of the file allows it (see RuleSet.get_bytes_rule_set()), the contents are left undecoded and the rules compiled
+# as bytes in that encoding are returned instead, the byte order mark (if any) being cut from the contents. Otherwise the
+# contents are decoded and the rule set is returned unchanged.
+def read_file(file_name: str, rule_set: RuleSet, newline: str = None) -> tuple[str | bytes, RuleSet, str, bytes]:
+    if not SETTINGS.BYTES_MODE:
+        with open(file_name, "r", encoding=SETTINGS.ENCODING, newline=newline) as original:
+            return original.read(), rule_set, SETTINGS.ENCODING, b""
+    with open(file_name, "rb") as original:
+        data = original.read()
+    encoding = detect_encoding(data[:ENCODING_SNIFF_SIZE])
+    byte_order_mark = b""
+    if encoding == "utf-8-sig":
+        byte_order_mark = codecs.BOM_UTF8
+    bytes_rule_set = rule_set.get_bytes_rule_set("utf-8" if byte_order_mark else encoding, data if newline is None else None)
+    if bytes_rule_set is None:
+        return io.TextIOWrapper(io.BytesIO(data), encoding=encoding, newline=newline).read(), rule_set, encoding, b""
+    return data[len(byte_order_mark):], bytes_rule_set, bytes_rule_set.encoding, byte_order_mark
+
+# returns the name of an encoding as written in XML declarations and "<meta charset>" tags, a byte order mark being handled by the codec
+def get_declared_encoding(encoding: str) -> str:
+    return "utf-8" if encoding == "utf-8-sig" else encoding
+
+# writes the changed contents of a file read by read_file() with write_changed_file(). Bytes are only checked to be valid in
+# the encoding of the file here, so files are never decoded unless they are changed: UnicodeDecodeError is raised if not.
+def write_file(file_name: str, contents: str | bytes, encoding: str, byte_order_mark: bytes, newline: str = None) -> str:
+    if isinstance(contents, bytes):
+        if not contents.isascii():
+            contents.decode(encoding)
+        return write_changed_file(file_name, byte_order_mark + contents)
+    return write_changed_file(file_name, contents, newline, encoding)
+
+# checks whether a relative path (using "/" as separator) or its last part matches any of the provided globs
+def matches_globs(rel_path: str, globs: list[str]) -> bool:
+    name = rel_path.rsplit("/", 1)[-1]
+    for glob in globs:
+        if fnmatch.fnmatchcase(rel_path, glob) or fnmatch.fnmatchcase(name, glob):
+            return True
+    return False
+
+# checks whether a file was written by the script itself as the changed copy of another one (see get_new_file_path())
+def is_new_file(name: str) -> bool:
+    return not SETTINGS.OVERWRITE_FILES and bool(SETTINGS.NEW_FILE_NAMES_SUFFIX) and os.path.splitext(name)[0].endswith(SETTINGS.NEW_FILE_NAMES_SUFFIX)
+
+# checks whether a file found during discovery should be processed. The new files written by the script are left out, since
+# files are discovered while earlier ones are being processed (and their new files written in the same directories).
+def is_file_to_use(rel_path: str, excluded_names: set[str]) -> bool:
+    name = rel_path.rsplit("/", 1)[-1]
+    if not name.endswith(tuple(SETTINGS.EXTENSIONS)):
+        return False
+    if is_new_file(name):
+        return False
+    if name in excluded_names:
+        return False
+    if SETTINGS.INCLUDE_GLOBS and not matches_globs(rel_path, SETTINGS.INCLUDE_GLOBS):
+        return False
+    if SETTINGS.EXCLUDE_GLOBS and matches_globs(rel_path, SETTINGS.EXCLUDE_GLOBS):
+        return False
+    return True
+
+# walks root_dir with os.scandir and yields the path (relative to root_dir) of every file to be processed as soon as it is found.
+# Directories deeper than SETTINGS.MAX_DEPTH (0 being root_dir itself, -1 for no limit) or matching EXCLUDE_GLOBS are not entered.
+def discover_files(root_dir: str, excluded_names: set[str]):
+    dirs_to_scan = [("", 0)] # (path relative to root_dir, depth)
+    while dirs_to_scan:
+        rel_dir, depth = dirs_to_scan.pop()
+        try:
+            entries = os.scandir(os.path.join(root_dir, rel_dir))
+        except OSError as e:
+            if rel_dir == "":
+                raise
+            print(f"Warning! The directory {rel_dir} could not be read and has been ignored: {e}")
+            continue
+        sub_dirs = []
+        with entries:
+            for entry in entries:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if (SETTINGS.MAX_DEPTH < 0 or depth < SETTINGS.MAX_DEPTH) and not (SETTINGS.EXCLUDE_GLOBS and matches_globs(rel_path, SETTINGS.EXCLUDE_GLOBS)):
+                            sub_dirs.append((rel_path, depth + 1))
+                    elif entry.is_file() and is_file_to_use(rel_path, excluded_names):
+                        yield rel_path
+                except OSError:
+                    continue
+        dirs_to_scan.extend(reversed(sub_dirs)) # sub directories are walked in the order they were listed
+
+# for plaintext/non-hypertext files, each line is treated on its own
+def process_plaintext_file(file: str, rule_set: RuleSet) -> FileResult:
+    if SETTINGS.PLAINTEXT_MODE == "WHOLE_FILE":
+        return process_whole_plaintext_file(file, rule_set)
+    result = FileResult()
+    file_name = get_file_path(file)
+    started = time.perf_counter()
+    contents, rule_set, encoding, byte_order_mark = read_file(file_name, rule_set)
+    started = result.add_time("read", started)
+    candidates = rule_set.candidates(contents)
+    if not candidates: # no rule can match anywhere in the file
+        result.add_time("match", started)
+        return result
+    change_log = ChangeLog(file, encoding)
+    new_lines = []
+    for i in (io.BytesIO(contents) if isinstance(contents, bytes) else io.StringIO(contents)): # for each line in the original file
+        i, line_changes = rule_set.apply(i, candidates)
+        for rule, old, new_log in line_changes:
+            change_log.add(rule, old, new_log)
+        new_lines.append(i)
+    change_log.record(result)
+    started = result.add_time("match", started)
+    if change_log: # only write a file if changes were actually made
+        contents = contents[:0].join(new_lines)
+        started = result.add_time("serialize", started)
+        print(write_file(file_name, contents, encoding, byte_order_mark))
+        result.add_time("write", started)
+    return result
+
+# applies the rules to a whole text in memory, so patterns can span multiple lines.
+# Returns the new text along with the (rule, matched text, replacement) of every replaced match.
+def apply_to_whole_text(rule_set: RuleSet, text: str, candidates: list[CompiledRule]) -> tuple[str, list[tuple[CompiledRule, str, str]]]:
+    changes = []
+    rules = candidates
+    i = 0
+    while i < len(rules):
+        rule = rules[i]
+        spans = [] # where each replacement ends up in the new text
+        sources = {} # the number of matches of each rule, which can be several for a LiteralGroup
+        delta = 0
+
+        def replace(match):
+            nonlocal delta
+            new = rule.expand(match)
+            source = rule.source(match)
+            changes.append((source, match.group(0), new))
+            sources[source] = sources.get(source, 0) + 1
+            add_span(rule_set, spans, match.start() + delta, match.start() + delta + len(new))
+            delta += len(new) - (match.end() - match.start())
+            return new
+
+        started = time.perf_counter()
+        text, count = rule.pattern.subn(replace, text)
+        if rule_set.stats is not None:
+            rule_set.record(rule, started, count, sources=list(sources.items()))
+        if count:
+            rules = rules[:i + 1] + merge_candidates(rules[i + 1:], get_candidates_near(rule_set, text, spans, rule.index))
+        i += 1
+    return text, changes
+
+# applies one rule to a whole buffer (bytes or mmap), copying the parts in between matches straight to the output file.
+# Every replaced match is added to the change log as it is found (the rule being the one of the group that matched for a
+# LiteralGroup). Returns the spans of the replacements in the output (see add_span()), and the number of matches of each
+# rule.
+def rewrite_buffer(rule_set: RuleSet, rule: CompiledRule | LiteralGroup, buffer, output, change_log: ChangeLog) -> tuple[list[tuple[int, int]], dict[CompiledRule, int]]:
+    spans = []
+    sources = {}
+    view = memoryview(buffer)
+    position = 0
+    output_position = 0
+    try:
+        for match in rule.pattern.finditer(buffer):
+            start, end = match.span()
+            output.write(view[position:start])
+            output_position += start - position
+            new = rule.expand(match)
+            output.write(new)
+            source = rule.source(match)
+            change_log.add(source, match.group(0), new)
+            sources[source] = sources.get(source, 0) + 1
+            add_span(rule_set, spans, output_position, output_position + len(new))
+            output_position += len(new)
+            position = end
+        output.write(view[position:])
+    finally:
+        view.release()
+    return spans, sources
+
+# memory-maps an open file for reading, empty files (which cannot be mapped) giving an empty buffer
+def map_file(f):
+    if os.fstat(f.fileno()).st_size == 0:
+        return contextlib.nullcontext(b"")
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+# Large files whose rules are all line local are rewritten in parts of about this many bytes, each ending with a newline
+LARGE_FILE_PART_SIZE = 4 * 1024 * 1024
+
+# returns the rules to search a large file with as bytes over an mmap (see RuleSet.get_bytes_rule_set()), or None if the
+# file has to be decoded in memory
+def get_large_file_rule_set(rule_set: RuleSet, file_name: str, encoding: str) -> RuleSet | None:
+    with open(file_name, "rb") as original, map_file(original) as buffer:
+        return rule_set.get_bytes_rule_set(encoding, buffer)
+
+# applies the rules to a large file as bytes over an mmap, without ever decoding it. If every rule is line local (see
+# RuleSet.is_line_local()), the file is read once, all the rules being applied in memory to one part of it at a time.
+# Otherwise each rule that matches writes the result to a temporary file, which the next rules read from.
+# Every replaced match is added to the change log as it is found, so they are never all held in memory. Returns the name
+# of the temporary file holding the final contents (None if nothing changed).
+def rewrite_large_file(rule_set: RuleSet, file_name: str, change_log: ChangeLog) -> str | None:
+    current_file_name = file_name
+    with open(file_name, "rb") as current, map_file(current) as buffer:
+        rules = rule_set.candidates(buffer)
+        if rules and rule_set.is_line_local():
+            return rewrite_large_file_by_parts(rule_set, file_name, buffer, change_log)
+    i = 0
+    try:
+        while i < len(rules):
+            with open(current_file_name, "rb") as current, map_file(current) as buffer:
+                while i < len(rules): # rules not matching are skipped without reopening the file
+                    started = time.perf_counter()
+                    found = rules[i].pattern.search(buffer)
+                    if rule_set.stats is not None:
+                        rule_set.record(rules[i], started, 0)
+                    if found:
+                        break
+                    i += 1
+                if i == len(rules):
+                    break
+                rule = rules[i]
+                i += 1
+                fd, temp_file_name = make_temp_file(file_name)
+                started = time.perf_counter()
+                try:
+                    with open(fd, "wb") as output:
+                        spans, sources = rewrite_buffer(rule_set, rule, buffer, output, change_log)
+                except BaseException:
+                    os.remove(temp_file_name)
+                    raise
+                if rule_set.stats is not None: # the search above was the attempt
+                    rule_set.record(rule, started, sum(sources.values()), attempts=0, sources=list(sources.items()))
+            if current_file_name != file_name:
+                os.remove(current_file_name)
+            current_file_name = temp_file_name
+            with open(current_file_name, "rb") as current, map_file(current) as buffer:
+                new_rules = get_candidates_near(rule_set, buffer, spans, rule.index)
+            rules = rules[:i] + merge_candidates(rules[i:], new_rules)
+    except BaseException:
+        if current_file_name != file_name:
+            os.remove(current_file_name)
+        raise
+    return current_file_name if current_file_name != file_name else None
+
+# applies line local rules to a large file one part at a time (see rewrite_large_file()), writing every part to a single
+# temporary file
+def rewrite_large_file_by_parts(rule_set: RuleSet, file_name: str, buffer, change_log: ChangeLog) -> str | None:
+    changed = False
+    fd, temp_file_name = make_temp_file(file_name)
+    try:
+        with open(fd, "wb") as output:
+            position = 0
+            while position < len(buffer):
+                end = buffer.find(b"\n", position + LARGE_FILE_PART_SIZE) + 1 or len(buffer)
+                part = buffer[position:end]
+                candidates = rule_set.candidates(part)
+                if candidates:
+                    part, part_changes = apply_to_whole_text(rule_set, part, candidates)
+                    for rule, old, new in part_changes:
+                        change_log.add(rule, old, new)
+                    changed = changed or bool(part_changes)
+                output.write(part)
+                position = end
+    except BaseException:
+        os.remove(temp_file_name)
+        raise
+    if not changed:
+        os.remove(temp_file_name)
+        return None
+    return temp_file_name
+
+# for plaintext/non-hypertext files with PLAINTEXT_MODE set to WHOLE_FILE, the rules are applied to the whole file at once
+# (with "^" and "$" still matching at the start and end of each line). Files of MMAP_MIN_SIZE bytes or more are processed
+# as bytes over an mmap when the encoding allows it, untouched parts being copied straight to the output.
+def process_whole_plaintext_file(file: str, rule_set: RuleSet) -> FileResult:
+    result = FileResult()
+    file_name = get_file_path(file)
+    encoding = get_file_encoding(file_name) if os.path.getsize(file_name) >= SETTINGS.MMAP_MIN_SIZE else None
+    bytes_rule_set = get_large_file_rule_set(rule_set, file_name, encoding) if encoding is not None else None
+    if bytes_rule_set is not None: # otherwise the rules would not match the same bytes, so the file is decoded in memory
+        started = time.perf_counter()
+        change_log = ChangeLog(file, encoding)
+        temp_file_name = rewrite_large_file(bytes_rule_set, file_name, change_log) # reading and matching at once
+        change_log.record(result)
+        started = result.add_time("match", started)
+        if temp_file_name is not None:
+            print(move_changed_file(file_name, temp_file_name))
+            result.add_time("write", started)
+        return result
+    started = time.perf_counter()
+    contents, rule_set, encoding, byte_order_mark = read_file(file_name, rule_set)
+    started = result.add_time("read", started)
+    candidates = rule_set.candidates(contents)
+    if not candidates: # no rule can match anywhere in the file
+        result.add_time("match", started)
+        return result
+    contents, changes = apply_to_whole_text(rule_set, contents, candidates)
+    change_log = ChangeLog(file, encoding)
+    for rule, old, new_log in changes:
+        change_log.add(rule, old, new_log)
+    change_log.record(result)
+    started = result.add_time("match", started)
+    if changes:
+        print(write_file(file_name, contents, encoding, byte_order_mark))
+        result.add_time("write", started)
+    return result
+
+# for hypertext files, every text node of the document is visited once
+def process_hypertext_file(file: str, rule_set: RuleSet) -> FileResult:
+    from bs4 import BeautifulSoup, Comment, ProcessingInstruction
+    from bs4.element import PreformattedString
+
+    result = FileResult()
+    file_name = get_file_path(file)
+    started = time.perf_counter()
+    contents, encoding = read_text_file(file_name)
+    started = result.add_time("read", started)
+    # entities are unescaped first, since text such as "&eacute;" is only turned into "é" by the parser
+    candidates = rule_set.candidates(html.unescape(contents) if "&" in contents else contents)
+    started = result.add_time("match", started)
+    if not candidates: # no rule can match anywhere in the file, it is not parsed at all
+        return result
+    changed_tags = False
+    has_unidentified_tags = False
+    is_xml = os.path.splitext(file_name)[1] == ".xml"
+    if is_xml: # to preserve XML (case sensitivity, etc)
+        soup = BeautifulSoup(contents, 'xml')
+    else:
+        soup = BeautifulSoup(contents, 'lxml')
+    started = result.add_time("parse", started)
+    change_log = ChangeLog(file, encoding) # changes are only recorded once the file is known not to be skipped
+    # a single traversal over every text node of the document, applying all rules to each node in order
+    for tag in soup.find_all(string=True):
+        if isinstance(tag, PreformattedString): # comments, doctypes, CDATA and '<? ... ?>' are never altered
+            # '<? ... ?>' tags are kept as processing instructions, or turned into comments starting with '?' by lxml's HTML parser
+            if SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS and not is_xml:
+                if isinstance(tag, ProcessingInstruction) or (isinstance(tag, Comment) and tag.startswith("?")):
+                    has_unidentified_tags = True
+            continue
+        if tag.parent is not None and tag.parent.name in SETTINGS.BANNED_TAGS:
+            continue
+        new_tag, tag_changes = rule_set.apply(str(tag), candidates)
+        if not tag_changes:
+            continue
+        for rule, old, new_log in tag_changes:
+            change_log.add(rule, old, new_log)
+        tag.replace_with(new_tag) # the node is replaced once, no matter how many rules changed it
+        changed_tags = True
+    started = result.add_time("match", started)
+    if changed_tags and has_unidentified_tags:
+        result.skip(file, "The file contains an unidentified tag (such as '<? ... ?>')")
+    elif changed_tags:
+        change_log.record(result)
+        contents = soup.decode(eventual_encoding=get_declared_encoding(encoding)) # declared as the file is written
+        started = result.add_time("serialize", started)
+        write_changed_file(file_name, contents, encoding=encoding)
+        result.add_time("write", started)
+    return result
+
+# HTML elements that never have contents, so they are never the parent of a text node
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "meta", "param", "source", "track", "wbr"}
+# HTML elements whose contents are read as is until their end tag, without any tags or entities
+RAW_TEXT_ELEMENTS = {"script", "style", "xmp", "iframe", "noembed", "noframes"}
+# HTML elements whose contents are read until their end tag, without any tags but with entities
+ESCAPABLE_RAW_TEXT_ELEMENTS = {"textarea", "title"}
+START_TAG_REGEX = re.compile(r"""<([A-Za-z][^\s/>]*)((?:[^>"']|"[^"]*"|'[^']*')*)>""")
+END_TAG_REGEX = re.compile(r"</([A-Za-z][^\s/>]*)[^>]*>")
+
+# tokenizes HTML just enough to find its text nodes, yielding (kind, start, end, parent tag name) for each of them, where kind is
+# "text" (entities to be unescaped), "rawtext" (script or style contents, used as is) or "unidentified" (a '<? ... ?>' tag).
+# Comments, doctypes, CDATA and tags are skipped. The parent is the innermost open element as written in the markup.
+def iter_html_text_spans(contents: str):
+    open_elements = []
+    position = 0
+    text_start = 0
+    length = len(contents)
+    while position < length:
+        lt = contents.find("<", position)
+        if lt == -1:
+            break
+        parent = open_elements[-1] if open_elements else None # of the text before lt, taken before the markup changes it
+        token_end = None # where the markup starting at lt ends, if it is markup at all
+        raw_text_element = None # set when a start tag opens an element whose contents are read as is
+        if contents.startswith("<!--", lt):
+            comment_end = contents.find("-->", lt + 4)
+            token_end = length if comment_end == -1 else comment_end + 3
+        elif contents.startswith("<![CDATA[", lt):
+            cdata_end = contents.find("]]>", lt + 9)
+            token_end = length if cdata_end == -1 else cdata_end + 3
+        elif contents.startswith("<!", lt) or contents.startswith("<?", lt):
+            markup_end = contents.find(">", lt + 2)
+            token_end = length if markup_end == -1 else markup_end + 1
+            if contents.startswith("<?", lt):
+                if text_start < lt:
+                    yield "text", text_start, lt, parent
+                yield "unidentified", lt, token_end, None
+                position = text_start = token_end
+                continue
+        elif contents.startswith("</", lt):
+            match = END_TAG_REGEX.match(contents, lt)
+            if match:
+                token_end = match.end()
+                name = match.group(1).lower()
+                if name in open_elements: # closes every element opened after it as well
+                    del open_elements[len(open_elements) - 1 - open_elements[::-1].index(name):]
+        else:
+            match = START_TAG_REGEX.match(contents, lt)
+            if match:
+                token_end = match.end()
+                name = match.group(1).lower()
+                if name not in VOID_ELEMENTS and not match.group(2).endswith("/"):
+                    open_elements.append(name)
+                    if name in RAW_TEXT_ELEMENTS or name in ESCAPABLE_RAW_TEXT_ELEMENTS:
+                        raw_text_element = name
+        if token_end is None: # a "<" which does not start any markup is part of the text
+            position = lt + 1
+            continue
+        if text_start < lt:
+            yield "text", text_start, lt, parent
+        position = text_start = token_end
+        if raw_text_element is not None: # the contents of these elements are read as is until their end tag
+            end_tag = re.compile(f"</{raw_text_element}[\\s/>]", re.IGNORECASE).search(contents, position)
+            content_end = length if end_tag is None else end_tag.start()
+            if position < content_end:
+                yield "rawtext" if raw_text_element in RAW_TEXT_ELEMENTS else "text", position, content_end, raw_text_element
+            position = text_start = content_end
+    if text_start < length:
+        yield "text", text_start, length, open_elements[-1] if open_elements else None
+
+# for the prefilter of an HTML file read as bytes, returns the text around each of its entities unescaped (encoded back), so
+# literals written with entities are found without decoding the whole file. Windows overlapping each other are joined.
+def get_unescaped_entities(contents: bytes, encoding: str) -> bytes:
+    reach = 4 * MAX_LITERAL_LENGTH # a character takes up to 4 bytes
+    windows = []
+    position = contents.find(b"&")
+    while position != -1:
+        start, end = max(0, position - reach), position + reach + 40 # entities are up to about 40 bytes long
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = end
+        else:
+            windows.append([start, end])
+        position = contents.find(b"&", position + 1)
+    texts = [html.unescape(contents[start:end].decode(encoding, errors="ignore")) for start, end in windows]
+    return "\n".join(texts).encode(encoding, errors="ignore")
+
+# escapes the text of a text node, as bytes or not
+def escape_text(text: str | bytes) -> str | bytes:
+    if isinstance(text, bytes):
+        return text.replace(b"&", b"&amp;").replace(b"<", b"&lt;").replace(b">", b"&gt;")
+    return html.escape(text, quote=False)
+
+# the words (along with the whitespace after them) text nodes are compared by in splice_text_node()
+TEXT_TOKEN_REGEX = re.compile(r"\S+\s*|\s+")
+TEXT_TOKEN_BYTES_REGEX = re.compile(rb"\S+\s*|\s+")
+
+# entities and character references, as found by html.unescape()
+HTML_CHARREF_REGEX = re.compile(r"&(#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[^\t\n\f <&#;]{1,32};?)")
+
+# returns the text of a text node with its entities unescaped, along with the position in raw where each character of the
+# text starts (-1 for the characters of an entity standing for more than one, other than the first), and len(raw) last
+def unescape_text_node(raw: str) -> tuple[str, list[int]]:
+    pieces = []
+    starts = []
+    position = 0
+    for match in HTML_CHARREF_REGEX.finditer(raw):
+        pieces.append(raw[position:match.start()])
+        starts.extend(range(position, match.start()))
+        unescaped = html.unescape(match.group(0))
+        pieces.append(unescaped)
+        if unescaped: # an entity standing for nothing stays with the character before it
+            starts.extend([match.start()] + [-1] * (len(unescaped) - 1))
+        position = match.end()
+    pieces.append(raw[position:])
+    starts.extend(range(position, len(raw)))
+    starts.append(len(raw))
+    starts[0] = 0
+    return "".join(pieces), starts
+
+# returns the raw text of a changed text node: the parts of its text the rules left unchanged are copied from raw as they
+# were written (entities included), and only the changed parts are escaped, with character references for the characters
+# the encoding cannot hold. starts is the one of unescape_text_node(), or None if raw has no entities.
+def splice_text_node(raw: str | bytes, text: str | bytes, starts: list[int] | None, new_text: str | bytes, encoding: str) -> str | bytes:
+    def escape(part):
+        if isinstance(part, bytes):
+            return escape_text(part)
+        return escape_text(part).encode(encoding, "xmlcharrefreplace").decode(encoding)
+
+    if escape_text(raw) == raw: # nothing to keep, the whole text is escaped the same way
+        return escape(new_text)
+
+    # the raw text of text[start:end], characters of an entity cut by either end being escaped
+    def get_raw(start, end):
+        if starts is None:
+            return raw[start:end]
+        head = start
+        while head < end and starts[head] == -1:
+            head += 1
+        tail = end
+        while tail > head and starts[tail] == -1:
+            tail -= 1
+        return escape(text[start:head]) + raw[starts[head]:starts[tail]] + escape(text[tail:end])
+
+    # whether text[start:end] has characters written as entities in raw
+    def has_entities(start, end):
+        raw_start = starts[start] if starts[start] != -1 else 0
+        raw_end = starts[end] if starts[end] != -1 else len(raw)
+        return raw_end - raw_start != end - start or "&" in raw[raw_start:raw_end]
+
+    # the texts are compared word by word (which is much faster than character by character), leaving out the parts that
+    # are the same at the start and end
+    prefix = len(os.path.commonprefix([text, new_text]))
+    suffix = len(os.path.commonprefix([text[prefix:][::-1], new_text[prefix:][::-1]]))
+    token_regex = TEXT_TOKEN_BYTES_REGEX if isinstance(text, bytes) else TEXT_TOKEN_REGEX
+    old_tokens = [match.span() for match in token_regex.finditer(text, prefix, len(text) - suffix)]
+    new_tokens = [match.span() for match in token_regex.finditer(new_text, prefix, len(new_text) - suffix)]
+    matcher = difflib.SequenceMatcher(None, [text[start:end] for start, end in old_tokens], [new_text[start:end] for start, end in new_tokens], autojunk=False)
+    pieces = [get_raw(0, prefix)]
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            pieces.append(get_raw(old_tokens[i1][0], old_tokens[i2 - 1][1]))
+        elif tag == "replace" and starts is not None and has_entities(old_tokens[i1][0], old_tokens[i2 - 1][1]):
+            # changed words with entities are compared character by character
+            old_start, old_end = old_tokens[i1][0], old_tokens[i2 - 1][1]
+            new_start, new_end = new_tokens[j1][0], new_tokens[j2 - 1][1]
+            char_matcher = difflib.SequenceMatcher(None, text[old_start:old_end], new_text[new_start:new_end], autojunk=False)
+            for char_tag, k1, k2, l1, l2 in char_matcher.get_opcodes():
+                if char_tag == "equal":
+                    pieces.append(get_raw(old_start + k1, old_start + k2))
+                else:
+                    pieces.append(escape(new_text[new_start + l1:new_start + l2]))
+        elif j1 < j2:
+            pieces.append(escape(new_text[new_tokens[j1][0]:new_tokens[j2 - 1][1]]))
+    pieces.append(get_raw(len(text) - suffix, len(text)))
+    new_raw = raw[:0].join(pieces)
+    if isinstance(new_raw, str) and "&" in new_raw and html.unescape(new_raw) != new_text: # a bare "&" now starts an entity
+        return escape(new_text)
+    return new_raw
+
+# for hypertext files with HYPERTEXT_ENGINE set to STREAM, the text nodes are found by a tokenizer and the rules are applied
+# to them in place: the rest of the file is written back exactly as it was read, without being parsed or serialized.
+# With BYTES_MODE, the file is tokenized and matched as bytes when its encoding allows it, only text nodes with entities
+# being decoded.
+def process_hypertext_stream_file(file: str, rule_set: RuleSet) -> FileResult:
+    result = FileResult()
+    file_name = get_file_path(file)
+    started = time.perf_counter()
+    contents, active_rule_set, encoding, byte_order_mark = read_file(file_name, rule_set, newline="")
+    started = result.add_time("read", started)
+    # entities are unescaped first, since text such as "&eacute;" is only turned into "é" once unescaped
+    if isinstance(contents, bytes):
+        markup = contents.decode("latin-1") # a character for each byte, which is all the tokenizer needs since markup is ASCII
+        candidates = active_rule_set.candidates(contents + b"\n" + get_unescaped_entities(contents, encoding) if b"&" in contents else contents)
+    else:
+        markup = contents
+        candidates = rule_set.candidates(html.unescape(contents) if "&" in contents else contents)
+    if not candidates: # no rule can match anywhere in the file
+        result.add_time("match", started)
+        return result
+    has_unidentified_tags = False
+    change_log = ChangeLog(file, encoding) # changes are only recorded once the file is known not to be skipped
+    pieces = [] # the new contents, made of untouched parts of the original and changed text nodes
+    copied_up_to = 0
+    for kind, start, end, parent in iter_html_text_spans(markup):
+        if kind == "unidentified":
+            if SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS:
+                has_unidentified_tags = True
+            continue
+        if parent in SETTINGS.BANNED_TAGS:
+            continue
+        raw = contents[start:end]
+        if kind == "text" and isinstance(raw, bytes) and b"&" in raw: # entities are unescaped in decoded text
+            decoded = raw.decode(encoding)
+            text, starts = unescape_text_node(decoded)
+            new_text, text_changes = rule_set.apply(text)
+            new_raw = splice_text_node(decoded, text, starts, new_text, encoding).encode(encoding) if text_changes else raw
+        elif kind == "text":
+            text, starts = unescape_text_node(raw) if isinstance(raw, str) and "&" in raw else (raw, None)
+            new_text, text_changes = active_rule_set.apply(text, candidates)
+            new_raw = splice_text_node(raw, text, starts, new_text, encoding) if text_changes else raw
+        else:
+            new_raw, text_changes = active_rule_set.apply(raw, candidates)
+        if not text_changes:
+            continue
+        for rule, old, new_log in text_changes:
+            change_log.add(rule, old, new_log)
+        pieces.append(contents[copied_up_to:start])
+        pieces.append(new_raw)
+        copied_up_to = end
+    started = result.add_time("match", started) # the file is tokenized while the rules are applied
+    if change_log and has_unidentified_tags:
+        result.skip(file, "The file contains an unidentified tag (such as '<? ... ?>')")
+    elif change_log:
+        pieces.append(contents[copied_up_to:])
+        change_log.record(result)
+        contents = contents[:0].join(pieces)
+        started = result.add_time("serialize", started)
+        write_file(file_name, contents, encoding, byte_order_mark, newline="")
+        result.add_time("write", started)
+    return result
+
+# returns the name of an XML element as written in the file (with its prefix, if any)
+def get_xml_name(name: str, nsmap: dict) -> str:
+    if not name.startswith("{"):
+        return name
+    uri, local_name = name[1:].split("}", 1)
+    if uri == XML_NAMESPACE:
+        return f"xml:{local_name}"
+    for prefix, prefix_uri in nsmap.items():
+        if prefix_uri == uri and prefix is not None:
+            return f"{prefix}:{local_name}"
+    return local_name
+
+# returns the name of an XML element with the prefix it is written with in the file, even if other prefixes (or the
+# default namespace) are bound to the same namespace
+def get_xml_element_name(element) -> str:
+    return get_xml_name(element.tag, {element.prefix: element.nsmap.get(element.prefix)})
+
+XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+XML_ATTRIBUTE_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "\t": "&#9;", "\n": "&#10;", "\r": "&#13;"})
+
+# returns the start tag of an XML element, declaring the namespaces its parent does not already have
+def get_xml_start_tag(element) -> str:
+    parent = element.getparent()
+    parent_nsmap = parent.nsmap if parent is not None else {}
+    nsmap = element.nsmap
+    parts = [get_xml_element_name(element)]
+    for prefix, uri in nsmap.items():
+        if parent_nsmap.get(prefix) != uri:
+            parts.append(f'xmlns:{prefix}="{uri.translate(XML_ATTRIBUTE_ESCAPES)}"' if prefix else f'xmlns="{uri.translate(XML_ATTRIBUTE_ESCAPES)}"')
+    for name, value in element.attrib.items():
+        parts.append(f'{get_xml_name(name, nsmap)}="{value.translate(XML_ATTRIBUTE_ESCAPES)}"')
+    return "<" + " ".join(parts) + ">"
+
+XML_COMMENT = r"<!--(?:[^-]|-(?!->))*-->"
+XML_PROCESSING_INSTRUCTION = r"<\?(?:[^?]|\?(?!>))*\?>"
+XML_QUOTED = r"\"[^\"]*\"|'[^']*'"
+# The prolog of an XML file: everything before the root element (byte order mark, XML declaration, doctype with its
+# internal subset, comments, processing instructions and whitespace). Each part can only be matched one way, so it never backtracks much.
+XML_PROLOG_REGEX = re.compile(rf"""\ufeff?(?:\s|{XML_COMMENT}|{XML_PROCESSING_INSTRUCTION}|<!DOCTYPE(?:[^\[>"']|{XML_QUOTED})*(?P<subset>\[(?:{XML_COMMENT}|{XML_PROCESSING_INSTRUCTION}|[^\]"'<]|<(?![!?])|<!(?!--)|{XML_QUOTED})*\])?\s*>)*(?=<[^!?/])""")
+XML_ENTITY_DECLARATION_REGEX = re.compile(r"<!ENTITY\s")
+# Prologs are only looked for in this many first characters of a file
+XML_PROLOG_MAX_SIZE = 1024 * 1024
+
+# returns the prolog of an XML file as it is written (see XML_PROLOG_REGEX), or None if it cannot be found
+def read_xml_prolog(file_name: str, encoding: str) -> re.Match | None:
+    with open(file_name, encoding=encoding, newline="") as f:
+        text = ""
+        while len(text) < XML_PROLOG_MAX_SIZE:
+            chunk = f.read(ENCODING_SNIFF_SIZE * 64)
+            text += chunk
+            match = XML_PROLOG_REGEX.match(text)
+            if match or not chunk:
+                return match
+    return None
+
+# for XML files with HYPERTEXT_ENGINE set to STREAM, the file is parsed incrementally with lxml's iterparse and written out
+# as it is read: the text and tail of each element are rewritten once complete, and elements are removed from the tree once
+# written, so memory use does not grow with the size of the file. The output goes to a temporary file which is only kept
+# if a change was made. The prolog is written back as it was, and files whose doctype declares entities are skipped,
+# since the parser would expand them in the rest of the file.
+def process_xml_stream_file(file: str, rule_set: RuleSet) -> FileResult:
+    from lxml import etree
+
+    result = FileResult()
+    file_name = get_file_path(file)
+    encoding = get_file_encoding(file_name)
+    change_log = ChangeLog(file, encoding)
+    prolog_match = read_xml_prolog(file_name, encoding)
+    if prolog_match is not None and prolog_match.group("subset") and XML_ENTITY_DECLARATION_REGEX.search(prolog_match.group("subset")):
+        result.skip(file, "The doctype of the file declares entities, which the STREAM engine would expand")
+        return result
+    prolog = [] # comments and processing instructions before the root element, only used if the prolog could not be found
+    pending = None # the (element, "text" or "tail") whose text comes next in the file, written once the next node starts
+    root_started = False
+    has_entities = False # only checked if the prolog could not be found
+    start_tag = None # the start tag of the element whose text is pending
+
+    # writes the pending text, rewritten if its parent is not banned
+    def write_pending(output):
+        element, slot = pending
+        text = element.text if slot == "text" else element.tail
+        if not text:
+            return
+        parent = element if slot == "text" else element.getparent()
+        if parent is not None and get_xml_element_name(parent) not in SETTINGS.BANNED_TAGS:
+            text, text_changes = rule_set.apply(text)
+            for rule, old, new_log in text_changes:
+                change_log.add(rule, old, new_log)
+        output.write(html.escape(text, quote=False))
+
+    started = time.perf_counter()
+    fd, temp_file_name = make_temp_file(file_name)
+    try:
+        with open(fd, "w", encoding=encoding) as output:
+            events = etree.iterparse(file_name, events=("start", "end", "comment", "pi"), encoding=get_declared_encoding(encoding), huge_tree=True)
+            for event, element in events:
+                if pending is not None and pending[1] == "text": # the start tag is only written now, to know whether it is empty
+                    if event == "end" and not pending[0].text:
+                        output.write(start_tag[:-1] + "/>")
+                        pending = (element, "tail")
+                        continue
+                    output.write(start_tag)
+                if pending is not None:
+                    write_pending(output)
+                    if pending[1] == "tail" and pending[0].getparent() is not None:
+                        pending[0].getparent().remove(pending[0]) # fully written, along with everything within it
+                    pending = None
+                if event == "start":
+                    if element.getparent() is None: # the root element, the XML declaration and doctype come first
+                        if prolog_match is not None:
+                            output.write(prolog_match.group(0))
+                        else:
+                            docinfo = element.getroottree().docinfo
+                            if docinfo.internalDTD is not None and list(docinfo.internalDTD.entities()):
+                                has_entities = True
+                                break
+                            standalone = ' standalone="yes"' if docinfo.standalone else ""
+                            output.write(f'<?xml version="{docinfo.xml_version or "1.0"}" encoding="{get_declared_encoding(encoding)}"{standalone}?>\n')
+                            if docinfo.doctype:
+                                output.write(docinfo.doctype + "\n")
+                            output.write("".join(prolog))
+                        root_started = True
+                    start_tag = get_xml_start_tag(element)
+                    pending = (element, "text")
+                elif event == "end":
+                    output.write(f"</{get_xml_element_name(element)}>")
+                    pending = (element, "tail")
+                else: # comments and processing instructions are written as they are
+                    node = etree.tostring(element, encoding="unicode", with_tail=False)
+                    if not root_started:
+                        prolog.append(node + "\n")
+                    else:
+                        output.write(node)
+                        pending = (element, "tail")
+            if pending is not None:
+                write_pending(output)
+    except etree.XMLSyntaxError as e:
+        os.remove(temp_file_name)
+        result.skip(file, f"The file could not be parsed as XML ({e})")
+        return result
+    except BaseException:
+        os.remove(temp_file_name)
+        raise
+    if has_entities:
+        os.remove(temp_file_name)
+        result.skip(file, "The doctype of the file declares entities, which the STREAM engine would expand")
+        return result
+    started = result.add_time("match", started) # the file is parsed, matched and written out at once
+    if not change_log:
+        os.remove(temp_file_name)
+        return result
+    change_log.record(result)
+    move_changed_file(file_name, temp_file_name)
+    result.add_time("write", started)
+    return result
+
+# A Scan finds which rules match the texts of a file for SCAN_MODE, without changing anything. With COUNTS, the rules are
+# applied to each text as in a real run (in memory only) so every change is counted. With RULES, each rule is only searched
+# for in the original texts until it is found once, and ANY stops at the first rule found.
+class Scan():
+    rule_set: RuleSet
+    candidates: list[CompiledRule | LiteralGroup] | None
+    remaining: dict[int, CompiledRule | LiteralGroup]
+    count: int
+    rule_hits: dict[int, int]
 
+    # candidates are the rules that can match in the file, every rule being tried if None
+    def __init__(self, rule_set: RuleSet, candidates: list[CompiledRule] = None):
+        self.rule_set = rule_set
+        self.candidates = candidates
+        self.remaining = {rule.index: rule for rule in (candidates if candidates is not None else rule_set.stages)}
+        self.count = 0
+        self.rule_hits = {}
+
+    # returns True once the requested detail is known, so the rest of the file does not need to be scanned
+    def is_done(self) -> bool:
+        return not self.remaining or (SETTINGS.SCAN_MODE == "ANY" and self.count > 0)
+
+    # scans a text of the file (a line, a text node, or the whole file if whole is True)
+    def add(self, text: str | bytes, whole: bool = False):
+        if SETTINGS.SCAN_MODE == "COUNTS":
+            if whole:
+                text, changes = apply_to_whole_text(self.rule_set, text, self.candidates)
+            else:
+                text, changes = self.rule_set.apply(text, self.candidates)
+            for rule, old, new in changes:
+                self.count += 1
+                self.rule_hits[rule.index] = self.rule_hits.get(rule.index, 0) + 1
+            return
+        rules = list(self.remaining.values())
+        if len(rules) > CANDIDATES_WITHOUT_PREFILTER:
+            rules = [rule for rule in self.rule_set.candidates(text) if rule.index in self.remaining]
+        for rule in rules:
+            started = time.perf_counter()
+            if isinstance(rule, LiteralGroup): # every rule of the group found in the text
+                found = {rule.source(match) for match in rule.pattern.finditer(text)}
+            else:
+                found = {rule} if rule.pattern.search(text) else set()
+            if self.rule_set.stats is not None:
+                self.rule_set.record(rule, started, len(found), sources=[(source, 1) for source in found])
+            for source in sorted(found, key=lambda source: source.index):
+                if source.index not in self.rule_hits:
+                    self.count += 1
+                    self.rule_hits[source.index] = 1
+            if found and (not isinstance(rule, LiteralGroup) or all(source.index in self.rule_hits for source in rule.rules)):
+                del self.remaining[rule.index]
+            if found and SETTINGS.SCAN_MODE == "ANY":
+                return
+
+    # adds the matches to the result of the file
+    def record(self, result: FileResult):
+        result.changes = self.count
+        result.rule_hits = self.rule_hits
+
+# scans a plaintext/non-hypertext file line by line, or as a whole with PLAINTEXT_MODE set to WHOLE_FILE. Large files are
+# searched as bytes over an mmap, unless every change has to be counted.
+def scan_plaintext_file(file: str, rule_set: RuleSet) -> FileResult:
+    result = FileResult()
+    file_name = get_file_path(file)
+    whole = SETTINGS.PLAINTEXT_MODE == "WHOLE_FILE"
+    started = time.perf_counter()
+    encoding = get_file_encoding(file_name) if os.path.getsize(file_name) >= SETTINGS.MMAP_MIN_SIZE else None
+    bytes_rule_set = get_large_file_rule_set(rule_set, file_name, encoding) if whole and SETTINGS.SCAN_MODE != "COUNTS" and encoding is not None else None
+    if bytes_rule_set is not None: # otherwise the file is decoded in memory
+        with open(file_name, "rb") as original, map_file(original) as buffer:
+            scan = Scan(bytes_rule_set, bytes_rule_set.candidates(buffer))
+            scan.add(buffer)
+        scan.record(result)
+        result.add_time("match", started)
+        return result
+    contents, encoding = read_text_file(file_name)
+    started = result.add_time("read", started)
+    scan = Scan(rule_set, rule_set.candidates(contents))
+    if whole:
+        scan.add(contents, whole=True)
+    else:
+        for line in io.StringIO(contents):
+            if scan.is_done():
+                break
+            scan.add(line)
+    scan.record(result)
+    result.add_time("match", started)
+    return result
+
+# scans the text nodes of an HTML file as found by the tokenizer of the STREAM engine, whichever engine is set, so no tree
+# is ever built. Text in banned tags is left out, and a file with matches is reported as skipped if it has unidentified tags.
+def scan_hypertext_file(file: str, rule_set: RuleSet) -> FileResult:
+    result = FileResult()
+    file_name = get_file_path(file)
+    started = time.perf_counter()
+    contents, encoding = read_text_file(file_name, newline="")
+    started = result.add_time("read", started)
+    candidates = rule_set.candidates(html.unescape(contents) if "&" in contents else contents)
+    if not candidates: # no rule can match anywhere in the file
+        result.add_time("match", started)
+        return result
+    scan = Scan(rule_set, candidates)
+    # once done, the rest of the file is still tokenized if it may contain an unidentified tag
+    may_be_skipped = SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS and "<?" in contents
+    has_unidentified_tags = False
+    for kind, start, end, parent in iter_html_text_spans(contents):
+        if kind == "unidentified":
+            if SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS:
+                has_unidentified_tags = True
+            continue
+        if scan.is_done():
+            if not may_be_skipped or has_unidentified_tags:
+                break
+            continue
+        if parent in SETTINGS.BANNED_TAGS:
+            continue
+        raw = contents[start:end]
+        scan.add(html.unescape(raw) if kind == "text" and "&" in raw else raw)
+    result.add_time("match", started)
+    if scan.count and has_unidentified_tags:
+        result.skip(file, "The file contains an unidentified tag (such as '<? ... ?>')")
+    else:
+        scan.record(result)
+    return result
+
+# scans the text of an XML file as parsed incrementally by lxml's iterparse, elements being removed once scanned as in the
+# STREAM engine. Text in banned tags is left out.
+def scan_xml_file(file: str, rule_set: RuleSet) -> FileResult:
+    from lxml import etree
+
+    result = FileResult()
+    file_name = get_file_path(file)
+    scan = Scan(rule_set)
+    pending = None # the (element, "text" or "tail") whose text comes next in the file, scanned once the next node starts
+
+    # scans the pending text if its parent is not banned
+    def scan_pending():
+        element, slot = pending
+        text = element.text if slot == "text" else element.tail
+        parent = element if slot == "text" else element.getparent()
+        if text and parent is not None and get_xml_element_name(parent) not in SETTINGS.BANNED_TAGS:
+            scan.add(text)
+
+    started = time.perf_counter()
+    try:
+        events = etree.iterparse(file_name, events=("start", "end", "comment", "pi"), encoding=get_declared_encoding(get_file_encoding(file_name)), huge_tree=True)
+        for event, element in events:
+            if pending is not None:
+                scan_pending()
+                if pending[1] == "tail" and pending[0].getparent() is not None:
+                    pending[0].getparent().remove(pending[0])
+                pending = None
+                if scan.is_done():
+                    break
+            pending = (element, "text" if event == "start" else "tail")
+        if pending is not None:
+            scan_pending()
+    except etree.XMLSyntaxError as e:
+        result.skip(file, f"The file could not be parsed as XML ({e})")
+        return result
+    result.add_time("match", started)
+    scan.record(result)
+    return result
+
+# scans a file for SCAN_MODE with the engine matching its kind, never writing anything
+def scan_file(file: str, rule_set: RuleSet) -> FileResult:
+    if SETTINGS.HYPERTEXT_SUPPORT and os.path.splitext(file)[1] == ".xml":
+        return scan_xml_file(file, rule_set)
+    if SETTINGS.HYPERTEXT_SUPPORT:
+        return scan_hypertext_file(file, rule_set)
+    return scan_plaintext_file(file, rule_set)
+
+# processes a file with the right engine (or only scans it if SCAN_MODE is set). If a fingerprint is provided, the manifest
+# entry of the file is added to the result
+def process_file(file: str, rule_set: RuleSet, fingerprint: str = None) -> FileResult:
+    rule_stats = {} if SETTINGS.PROFILE_FILE_NAME else None
+    rule_set.set_profile(rule_stats) # each file gets its own rule statistics, sent back along with its result
+    try:
+        if SETTINGS.SCAN_MODE != "OFF":
+            result = scan_file(file, rule_set)
+        elif SETTINGS.HYPERTEXT_SUPPORT and SETTINGS.HYPERTEXT_ENGINE == "STREAM" and os.path.splitext(file)[1] == ".xml":
+            result = process_xml_stream_file(file, rule_set)
+        elif SETTINGS.HYPERTEXT_SUPPORT and SETTINGS.HYPERTEXT_ENGINE == "STREAM":
+            result = process_hypertext_stream_file(file, rule_set)
+        elif SETTINGS.HYPERTEXT_SUPPORT:
+            result = process_hypertext_file(file, rule_set)
+        else:
+            result = process_plaintext_file(file, rule_set)
+    except UnicodeError as e: # a file in another encoding than expected is skipped instead of stopping the run
+        result = FileResult()
+        action = "decoded" if isinstance(e, UnicodeDecodeError) else "encoded"
+        result.skip(file, f"The file could not be {action} as {getattr(e, 'encoding', None) or 'its encoding'} ({getattr(e, 'reason', e)})")
+    if fingerprint is not None and not result.skipped and SETTINGS.SCAN_MODE == "OFF":
+        result.manifest_entry = get_manifest_entry(get_file_path(file), fingerprint, "changed" if result.changes else "unchanged")
+    if rule_stats:
+        result.rule_stats = rule_stats
+    return result
+
+# returns the JSONL log record of a processed file
+def get_log_record(file: str, result: FileResult, strings: list[ReplacementStr]) -> str:
+    status = "skipped" if result.skipped else "changed" if SETTINGS.SCAN_MODE == "OFF" else "matched"
+    record = {"file": file, "time": datetime.now().isoformat(), "status": status}
+    if result.skipped:
+        record["reason"] = result.skip_reason
+    else:
+        record["changes"] = result.changes
+        record["rules"] = [{"rule": index + 1, "find": strings[index].find, "hits": hits} for index, hits in sorted(result.rule_hits.items())]
+        if result.snippets:
+            record["snippets"] = result.snippets
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+# returns the text log entry summing up the changes of a processed file, used when changes are not logged one by one and
+# for scanned files. With SCAN_MODE set to RULES or ANY, only the rules found are listed.
+def get_log_summary(file: str, result: FileResult) -> str:
+    if SETTINGS.SCAN_MODE in ("RULES", "ANY"):
+        rules = ", ".join(f"rule {index + 1}" for index in sorted(result.rule_hits))
+        return f"{file} MATCHES ({datetime.now()}): {rules}\n"
+    hits = ", ".join(f"rule {index + 1}: {count}" for index, count in sorted(result.rule_hits.items()))
+    return f"{file} {'CHANGES' if SETTINGS.SCAN_MODE == 'OFF' else 'MATCHES'} ({datetime.now()}): {result.changes} ({hits})\n"
+
+# writes the logs of a processed file and records it in the manifest, returns the number of changes made in the file
+def collect_result(file: str, result: FileResult, logs, strings: list[ReplacementStr], manifest: Manifest = None) -> int:
+    if SETTINGS.LOG_FORMAT == "JSONL":
+        if result.changes or result.skipped: # one record per file
+            logs.write(get_log_record(file, result, strings))
+    else:
+        for info in result.logs:
+            logs.write(info)
+        if result.changes and (SETTINGS.LOG_VERBOSITY != "CHANGES" or SETTINGS.SCAN_MODE != "OFF"):
+            logs.write(get_log_summary(file, result))
+    if manifest is not None and result.manifest_entry is not None:
+        manifest.record(get_file_path(file), result.manifest_entry)
+    return result.changes
+
+# number of log entries written to the logs file at once
+LOG_BATCH_SIZE = 512
+
+# The LogWriter buffers log entries and hands them in batches to a background thread writing them to the logs file,
+# so files are not waiting on the disk to be processed. Entries are written in the order they were received.
+class LogWriter():
+    logs: io.TextIOBase
+    batch: list[str]
+    batches: queue.Queue
+    thread: threading.Thread
+    error: BaseException | None
+
+    def __init__(self, logs):
+        self.logs = logs
+        self.batch = []
+        self.batches = queue.Queue(maxsize=16) # bounded, so logs cannot pile up in memory if the disk is slower
+        self.error = None
+        self.thread = threading.Thread(target=self.write_batches, daemon=True)
+        self.thread.start()
+
+    def write_batches(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                return
+            if self.error is None:
+                try:
+                    self.logs.write("".join(batch))
+                except BaseException as e: # raised again by the main thread
+                    self.error = e
+
+    def write(self, info: str):
+        self.batch.append(info)
+        if len(self.batch) >= LOG_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+        if self.batch:
+            self.batches.put(self.batch)
+            self.batch = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # writes the remaining entries and waits for the thread to finish
+    def close(self):
+        if self.batch and self.error is None:
+            self.batches.put(self.batch)
+            self.batch = []
+        self.batches.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+# compiles the rules for the current settings, "^" and "$" matching at each line when whole plaintext files are processed
+def build_rule_set(strings: list[ReplacementStr]) -> RuleSet:
+    if not SETTINGS.HYPERTEXT_SUPPORT and SETTINGS.PLAINTEXT_MODE == "WHOLE_FILE":
+        return RuleSet(strings, re.MULTILINE, group_literals=SETTINGS.LITERAL_GROUPS)
+    return RuleSet(strings, group_literals=SETTINGS.LITERAL_GROUPS)
+
+# number of files handed to a worker process at a time
+WORKER_CHUNK_SIZE = 16
+worker_rule_set: RuleSet = None # the rule set compiled by the parent process, inherited by each forked worker process
+worker_fingerprint: str = None
+
+def init_worker(rule_set: RuleSet, fingerprint: str = None):
+    global worker_rule_set, worker_fingerprint
+    worker_rule_set = rule_set
+    worker_fingerprint = fingerprint
+
+def process_file_in_worker(file: str) -> tuple[str, FileResult]:
+    return file, process_file(file, worker_rule_set, worker_fingerprint)
 
 if __file__ != "__main__":
     SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__)) + "/"
 else:
     SCRIPT_DIR = os.getcwd()
 
-print(f"Script is currently located at: {SCRIPT_DIR}. This will be taken as the working directory if no custom directory is specified otherwise.\n")
-
-if os.path.exists(SCRIPT_DIR + 'findrepl.cfg'): # check if findrepl.cfg is in the script's directory
-    print("Config file \"findrepl.cfg\" has been found in the script directory.")
-    config_filename = "findrepl.cfg"
-else: # findrepl.cfg not found in script directory
-    config_filename = input("Enter the config file's filename, or press ENTER to continue with default settings: ")
-    if config_filename == "":
-        print("Script will run using the default settings listed below:")
-        print(f"DELIMITER: \"{SETTINGS.DELIMITER}\"")
-        print(f"Hypertext Support: {SETTINGS.HYPERTEXT_SUPPORT}")
-        print(f"Current Directory For Files: {SETTINGS.PROCESS_FILES_IN_CURRENT_DIR}")
-        print(f"Save log for files that will be scanned: {SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG}")
-        print(f"Run with warnings: {SETTINGS.RUN_WITH_WARNINGS}")
-        print(f"Extensions: {SETTINGS.EXTENSIONS}")
-        print(f"Banned tags: {SETTINGS.BANNED_TAGS}")
-        print(f"Default encoding: {SETTINGS.ENCODING}")
-        print(f"Overwrite Files: {SETTINGS.OVERWRITE_FILES}")
-        print(f"Suffix for new file names: \"{SETTINGS.NEW_FILE_NAMES_SUFFIX}\"")
-        print(f"Logs file filename: {SETTINGS.LOGS_FILE_NAME}")
-        print(f"Strings file filename: {SETTINGS.STRINGS_FILE_NAME}")
-        print(f"Skip Files with unidentified tags: {SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS}")
-
-if config_filename != "": # if a config file is provided
+# names of every setting, as used in config files, and their default values
+SETTING_NAMES = list(SETTINGS.__annotations__)
+DEFAULT_SETTINGS = {name: getattr(SETTINGS, name) for name in SETTING_NAMES}
+
+# puts every setting back to its default value, so settings read from a config file do not carry over to the next one
+def reset_settings():
+    for name, value in DEFAULT_SETTINGS.items():
+        setattr(SETTINGS, name, list(value) if isinstance(value, list) else value)
+
+# applies one setting from a config file (or from the command line), checking its validity. Unknown names are ignored.
+def apply_setting(key: str, value: str, verbose: bool = True):
+    say = print if verbose else lambda *args: None
+    if key == "DELIMITER":
+        SETTINGS.DELIMITER = value
+        say(f"DELIMITER: \"{value}\"")
+    if key == "HYPERTEXT_SUPPORT":
+        if value == "YES":
+            SETTINGS.HYPERTEXT_SUPPORT = True
+        elif value == "NO":
+            SETTINGS.HYPERTEXT_SUPPORT = False
+        else:
+            raise InvalidSettingException(key)
+        say(f"Hypertext Support: {value}")
+    if key == "PROCESS_FILES_IN_CURRENT_DIR":
+        if value == "YES":
+            SETTINGS.PROCESS_FILES_IN_CURRENT_DIR = True
+        elif value == "NO":
+            SETTINGS.PROCESS_FILES_IN_CURRENT_DIR = False
+        else:
+            raise InvalidSettingException(key)
+        say(f"Current Directory For Files: {value}")
+    if key == "FILES_CUSTOM_DIR":
+        if value[-1] == "/":
+            value = value[:-1]
+        SETTINGS.FILES_CUSTOM_DIR = value
+        if not SETTINGS.PROCESS_FILES_IN_CURRENT_DIR:
+            say(f"Custom Files Directory: {value}")
+    if key == "SAVE_FILES_THAT_WILL_BE_SCANNED_LOG":
+        if value == "YES":
+            SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG = True
+        elif value == "NO":
+            SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG = False
+        else:
+            raise InvalidSettingException(key)
+        say(f"Save log for files that will be scanned: {value}")
+    if key == "RUN_WITH_WARNINGS":
+        if value == "YES":
+            SETTINGS.RUN_WITH_WARNINGS = True
+        elif value == "NO":
+            SETTINGS.RUN_WITH_WARNINGS = False
+        else:
+            raise InvalidSettingException(key)
+        say(f"Run with warnings: {value}")
+    if key == "EXTENSIONS":
+        SETTINGS.EXTENSIONS = value.split(",")
+        say(f"Extensions: {value}")
+    if key == "BANNED_TAGS":
+        SETTINGS.BANNED_TAGS = value.split(",")
+        say(f"Banned tags: {value}")
+    if key == "ENCODING":
+        SETTINGS.ENCODING = value
+        say(f"Default encoding: {value}")
+    if key == "OVERWRITE_FILES":
+        if value == "YES":
+            SETTINGS.OVERWRITE_FILES = True
+        elif value == "NO":
+            SETTINGS.OVERWRITE_FILES = False
+        else:
+            raise InvalidSettingException(key)
+        say(f"Overwrite Files: {value}")
+    if key == "NEW_FILE_NAMES_SUFFIX":
+        SETTINGS.NEW_FILE_NAMES_SUFFIX = value
+        if not SETTINGS.OVERWRITE_FILES:
+            say(f"Suffix for new file names: \"{value}\"")
+    if key == "LOGS_FILE_NAME":
+        if value and value is not None:
+            SETTINGS.LOGS_FILE_NAME = value
+        else:
+            raise InvalidSettingException(key)
+        say(f"Logs file filename: {value}")
+    if key == "STRINGS_FILE_NAME":
+        if value and value is not None:
+            SETTINGS.STRINGS_FILE_NAME = value
+        else:
+            raise InvalidSettingException(key)
+        say(f"Strings file filename: {value}")
+    if key == "BANNED_FILE_NAMES":
+        if value and value is not None:
+            SETTINGS.BANNED_FILE_NAMES = value.split(",")
+        else:
+            raise InvalidSettingException(key)
+        say(f"Banned filenames: {value}")
+    if key == "SKIP_FILES_WITH_UNIDENTIFIED_TAGS":
+        if value == "YES":
+            SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS = True
+        elif value == "NO":
+            SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS = False
+        else:
+            raise InvalidSettingException(key)
+        say(f"Skip files with unidentified tags: {value}")
+    if key == "WORKERS": # optional, files are processed one at a time if missing
+        if value == "AUTO":
+            SETTINGS.WORKERS = os.cpu_count() or 1
+        elif value.isdigit() and int(value) > 0:
+            SETTINGS.WORKERS = int(value)
+        else:
+            raise InvalidSettingException(key)
+        say(f"Workers: {SETTINGS.WORKERS}")
+    if key == "MAX_DEPTH": # optional, only the top directory is searched if missing
+        if value == "UNLIMITED":
+            SETTINGS.MAX_DEPTH = -1
+        elif value.isdigit():
+            SETTINGS.MAX_DEPTH = int(value)
+        else:
+            raise InvalidSettingException(key)
+        say(f"Max directory depth: {value}")
+    if key == "INCLUDE_GLOBS": # optional, every file is included if missing
+        SETTINGS.INCLUDE_GLOBS = [glob for glob in value.split(",") if glob]
+        say(f"Include globs: {value}")
+    if key == "EXCLUDE_GLOBS": # optional, no file is excluded if missing
+        SETTINGS.EXCLUDE_GLOBS = [glob for glob in value.split(",") if glob]
+        say(f"Exclude globs: {value}")
+    if key == "PLAINTEXT_MODE": # optional, files are processed line by line if missing
+        if value in ("LINES", "WHOLE_FILE"):
+            SETTINGS.PLAINTEXT_MODE = value
+        else:
+            raise InvalidSettingException(key)
+        say(f"Plaintext mode: {value}")
+    if key == "HYPERTEXT_ENGINE": # optional, BeautifulSoup is used if missing
+        if value in ("SOUP", "STREAM"):
+            SETTINGS.HYPERTEXT_ENGINE = value
+        else:
+            raise InvalidSettingException(key)
+        say(f"Hypertext engine: {value}")
+    if key == "MMAP_MIN_SIZE": # optional, 64 MiB if missing
+        if value.isdigit():
+            SETTINGS.MMAP_MIN_SIZE = int(value)
+        else:
+            raise InvalidSettingException(key)
+        say(f"Minimum size of files processed over an mmap: {value}")
+    if key == "LOG_FORMAT": # optional, text entries are logged if missing
+        if value in ("TEXT", "JSONL"):
+            SETTINGS.LOG_FORMAT = value
+        else:
+            raise InvalidSettingException(key)
+        say(f"Log format: {value}")
+    if key == "LOG_VERBOSITY": # optional, every change is logged if missing
+        if value in ("CHANGES", "RULES"):
+            SETTINGS.LOG_VERBOSITY = value
+        else:
+            raise InvalidSettingException(key)
+        say(f"Log verbosity: {value}")
+    if key == "LOG_SNIPPET_LENGTH": # optional, 200 if missing
+        if value.isdigit():
+            SETTINGS.LOG_SNIPPET_LENGTH = int(value)
+        else:
+            raise InvalidSettingException(key)
+        say(f"Log snippet length: {value}")
+    if key == "BYTES_MODE": # optional, every file is decoded with ENCODING if missing
+        if value == "YES":
+            SETTINGS.BYTES_MODE = True
+        elif value == "NO":
+            SETTINGS.BYTES_MODE = False
+        else:
+            raise InvalidSettingException(key)
+        say(f"Bytes mode: {value}")
+    if key == "LITERAL_GROUPS": # optional, every rule is applied on its own if missing
+        if value == "YES":
+            SETTINGS.LITERAL_GROUPS = True
+        elif value == "NO":
+            SETTINGS.LITERAL_GROUPS = False
+        else:
+            raise InvalidSettingException(key)
+        say(f"Literal groups: {value}")
+    if key == "WATCH_ENGINE": # optional, inotify is used where available if missing
+        if value in ("AUTO", "POLL"):
+            SETTINGS.WATCH_ENGINE = value
+        else:
+            raise InvalidSettingException(key)
+        say(f"Watch engine: {value}")
+    if key == "WATCH_DELAY": # optional, 1 second if missing
+        try:
+            SETTINGS.WATCH_DELAY = float(value)
+        except ValueError:
+            raise InvalidSettingException(key)
+        if SETTINGS.WATCH_DELAY < 0:
+            raise InvalidSettingException(key)
+        say(f"Watch delay: {value} seconds")
+    if key == "WATCH_POLL_INTERVAL": # optional, 2 seconds if missing
+        try:
+            SETTINGS.WATCH_POLL_INTERVAL = float(value)
+        except ValueError:
+            raise InvalidSettingException(key)
+        if SETTINGS.WATCH_POLL_INTERVAL <= 0:
+            raise InvalidSettingException(key)
+        say(f"Watch poll interval: {value} seconds")
+    if key == "MANIFEST_FILE_NAME": # optional, every file is processed on every run if missing or empty
+        SETTINGS.MANIFEST_FILE_NAME = value
+        if value:
+            say(f"Manifest file filename: {value}")
+    if key == "SCAN_MODE": # optional, files are changed if missing
+        if value in ("OFF", "ANY", "RULES", "COUNTS"):
+            SETTINGS.SCAN_MODE = value
+        else:
+            raise InvalidSettingException(key)
+        say(f"Scan mode: {value}")
+    if key == "JOURNAL_FILE_NAME": # optional, stopped runs start over if missing or empty
+        SETTINGS.JOURNAL_FILE_NAME = value
+        if value:
+            say(f"Journal file filename: {value}")
+    if key == "SHARD": # optional, every file is processed if missing or empty
+        SETTINGS.SHARD = None
+        if value:
+            SETTINGS.SHARD = parse_shard(value)
+            if SETTINGS.SHARD is None:
+                raise InvalidSettingException(key)
+            say(f"Shard: {value}")
+    if key == "PROFILE_FILE_NAME": # optional, nothing is profiled if missing or empty
+        SETTINGS.PROFILE_FILE_NAME = value
+        if value:
+            say(f"Profile file filename: {value}")
+
+# reads a config file (relative to the script directory, or absolute), every required setting having to be in it
+def read_config(config_filename: str, verbose: bool = True):
+    reset_settings()
     # empty the defaults (so missing settings in the config file can be identified)
-    SETTINGS.DELIMITER: str = None
-    SETTINGS.HYPERTEXT_SUPPORT: bool = None
-    SETTINGS.PROCESS_FILES_IN_CURRENT_DIR: bool = None
-    SETTINGS.FILES_CUSTOM_DIR: str = None
-    SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG: bool = None
-    SETTINGS.RUN_WITH_WARNINGS: bool = None
-    SETTINGS.EXTENSIONS: list[str] = None
-    SETTINGS.BANNED_TAGS: list[str] = None
-    SETTINGS.ENCODING: str = None
-    SETTINGS.OVERWRITE_FILES: bool = None
-    SETTINGS.NEW_FILE_NAMES_SUFFIX: str = None
-    SETTINGS.LOGS_FILE_NAME: str = None
-    SETTINGS.STRINGS_FILE_NAME: str = None
-    SETTINGS.BANNED_FILE_NAMES: list[str] = None
-    SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS: bool = None
-
-
-    if os.path.exists(SCRIPT_DIR + config_filename):
+    SETTINGS.DELIMITER = None
+    SETTINGS.HYPERTEXT_SUPPORT = None
+    SETTINGS.PROCESS_FILES_IN_CURRENT_DIR = None
+    SETTINGS.FILES_CUSTOM_DIR = None
+    SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG = None
+    SETTINGS.RUN_WITH_WARNINGS = None
+    SETTINGS.EXTENSIONS = None
+    SETTINGS.BANNED_TAGS = None
+    SETTINGS.ENCODING = None
+    SETTINGS.OVERWRITE_FILES = None
+    SETTINGS.NEW_FILE_NAMES_SUFFIX = None
+    SETTINGS.LOGS_FILE_NAME = None
+    SETTINGS.STRINGS_FILE_NAME = None
+    SETTINGS.BANNED_FILE_NAMES = None
+    SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS = None
+
+    if verbose:
         print(f"{config_filename} will be used for carrying out the operations.")
 
     # Loading all the settings from the config file and ensuring their validity
-    with open(SCRIPT_DIR + config_filename, 'r') as config_file:
+    with open(os.path.join(SCRIPT_DIR, config_filename), 'r') as config_file:
         for line in config_file:
             line = line.strip("\n").split("=")
-            if line[0] == "DELIMITER":
-                SETTINGS.DELIMITER = line[1]
-                print(f"DELIMITER: \"{line[1]}\"")
-            if line[0] == "HYPERTEXT_SUPPORT":
-                if line[1] == "YES":
-                    SETTINGS.HYPERTEXT_SUPPORT = True
-                elif line[1] == "NO":
-                    SETTINGS.HYPERTEXT_SUPPORT = False
-                else:
-                    raise InvalidSettingException(line[0])
-                print(f"Hypertext Support: {line[1]}")
-            if line[0] == "PROCESS_FILES_IN_CURRENT_DIR":
-                if line[1] == "YES":
-                    SETTINGS.PROCESS_FILES_IN_CURRENT_DIR = True
-                elif line[1] == "NO":
-                    SETTINGS.PROCESS_FILES_IN_CURRENT_DIR = False
-                else:
-                    raise InvalidSettingException(line[0])
-                print(f"Current Directory For Files: {line[1]}")
-            if line[0] == "FILES_CUSTOM_DIR":
-                if line[1][-1] == "/":
-                    line[1] = line[1][:-1]
-                SETTINGS.FILES_CUSTOM_DIR = line[1]
-                if not SETTINGS.PROCESS_FILES_IN_CURRENT_DIR:
-                    print(f"Custom Files Directory: {line[1]}")
-            if line[0] == "SAVE_FILES_THAT_WILL_BE_SCANNED_LOG":
-                if line[1] == "YES":
-                    SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG = True
-                elif line[1] == "NO":
-                    SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG = False
-                else:
-                    raise InvalidSettingException(line[0])
-                print(f"Save log for files that will be scanned: {line[1]}")
-            if line[0] == "RUN_WITH_WARNINGS":
-                if line[1] == "YES":
-                    SETTINGS.RUN_WITH_WARNINGS = True
-                elif line[1] == "NO":
-                    SETTINGS.RUN_WITH_WARNINGS = False
-                else:
-                    raise InvalidSettingException(line[0])
-                print(f"Run with warnings: {line[1]}")
-            if line[0] == "EXTENSIONS":
-                SETTINGS.EXTENSIONS = line[1].split(",")
-                print(f"Extensions: {line[1]}")
-            if line[0] == "BANNED_TAGS":
-                SETTINGS.BANNED_TAGS = line[1].split(",")
-                print(f"Banned tags: {line[1]}")
-            if line[0] == "ENCODING":
-                SETTINGS.ENCODING = line[1]
-                print(f"Default encoding: {line[1]}")
-            if line[0] == "OVERWRITE_FILES":
-                if line[1] == "YES":
-                    SETTINGS.OVERWRITE_FILES = True
-                elif line[1] == "NO":
-                    SETTINGS.OVERWRITE_FILES = False
-                else:
-                    raise InvalidSettingException(line[0])
-                print(f"Overwrite Files: {line[1]}")
-            if line[0] == "NEW_FILE_NAMES_SUFFIX":
-                SETTINGS.NEW_FILE_NAMES_SUFFIX = line[1]
-                if not SETTINGS.OVERWRITE_FILES:
-                    print(f"Suffix for new file names: \"{line[1]}\"")
-            if line[0] == "LOGS_FILE_NAME":
-                if line[1] and line[1] is not None:
-                    SETTINGS.LOGS_FILE_NAME = line[1]
-                else:
-                    raise InvalidSettingException(line[0])
-                print(f"Logs file filename: {line[1]}")
-            if line[0] == "STRINGS_FILE_NAME":
-                if line[1] and line[1] is not None:
-                    SETTINGS.STRINGS_FILE_NAME = line[1]
-                else:
-                    raise InvalidSettingException(line[0])
-                print(f"Strings file filename: {line[1]}")
-            if line[0] == "BANNED_FILE_NAMES":
-                if line[1] and line[1] is not None:
-                    SETTINGS.BANNED_FILE_NAMES = line[1].split(",")
-                else:
-                    raise InvalidSettingException(line[0])
-                print(f"Banned filenames: {line[1]}")
-            if line[0] == "SKIP_FILES_WITH_UNIDENTIFIED_TAGS":
-                if line[1] == "YES":
-                    SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS = True
-                elif line[1] == "NO":
-                    SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS = False
-                else:
-                    raise InvalidSettingException(line[0])
-                print(f"Skip files with unidentified tags: {line[1]}")
+            if len(line) > 1:
+                apply_setting(line[0], line[1], verbose)
+    check_settings()
 
 # Ensuring all settings exist to avoid issues during operations
-try:
-    if SETTINGS.DELIMITER == None:
+def check_settings():
+    try:
+        if SETTINGS.DELIMITER == None:
+            raise MissingSettingException("DELIMITER")
+    except:
         raise MissingSettingException("DELIMITER")
-except:
-    raise MissingSettingException("DELIMITER")
-try:
-    if SETTINGS.HYPERTEXT_SUPPORT == None:
+    try:
+        if SETTINGS.HYPERTEXT_SUPPORT == None:
+            raise MissingSettingException("HYPERTEXT_SUPPORT")
+    except:
         raise MissingSettingException("HYPERTEXT_SUPPORT")
-except:
-    raise MissingSettingException("HYPERTEXT_SUPPORT")
-try:
-    if SETTINGS.PROCESS_FILES_IN_CURRENT_DIR == None:
+    try:
+        if SETTINGS.PROCESS_FILES_IN_CURRENT_DIR == None:
+            raise MissingSettingException("PROCESS_FILES_IN_CURRENT_DIR")
+    except:
         raise MissingSettingException("PROCESS_FILES_IN_CURRENT_DIR")
-except:
-    raise MissingSettingException("PROCESS_FILES_IN_CURRENT_DIR")
-try:
-    if SETTINGS.FILES_CUSTOM_DIR == None:
+    try:
+        if SETTINGS.FILES_CUSTOM_DIR == None:
+            raise MissingSettingException("FILES_CUSTOM_DIR")
+    except:
         raise MissingSettingException("FILES_CUSTOM_DIR")
-except:
-    raise MissingSettingException("FILES_CUSTOM_DIR")
-try:
-    if SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG == None:
+    try:
+        if SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG == None:
+            raise MissingSettingException("SAVE_FILES_THAT_WILL_BE_SCANNED_LOG")
+    except:
         raise MissingSettingException("SAVE_FILES_THAT_WILL_BE_SCANNED_LOG")
-except:
-    raise MissingSettingException("SAVE_FILES_THAT_WILL_BE_SCANNED_LOG")
-try:
-    if SETTINGS.RUN_WITH_WARNINGS == None:
+    try:
+        if SETTINGS.RUN_WITH_WARNINGS == None:
+            raise MissingSettingException("RUN_WITH_WARNINGS")
+    except:
         raise MissingSettingException("RUN_WITH_WARNINGS")
-except:
-    raise MissingSettingException("RUN_WITH_WARNINGS")
-try:
-    if SETTINGS.EXTENSIONS == None:
+    try:
+        if SETTINGS.EXTENSIONS == None:
+            raise MissingSettingException("EXTENSIONS")
+    except:
         raise MissingSettingException("EXTENSIONS")
-except:
-    raise MissingSettingException("EXTENSIONS")
-try:
-    if SETTINGS.BANNED_TAGS == None:
+    try:
+        if SETTINGS.BANNED_TAGS == None:
+            raise MissingSettingException("BANNED_TAGS")
+    except:
         raise MissingSettingException("BANNED_TAGS")
-except:
-    raise MissingSettingException("BANNED_TAGS")
-try:
-    if SETTINGS.ENCODING == None:
+    try:
+        if SETTINGS.ENCODING == None:
+            raise MissingSettingException("ENCODING")
+    except:
         raise MissingSettingException("ENCODING")
-except:
-    raise MissingSettingException("ENCODING")
-try:
-    if SETTINGS.OVERWRITE_FILES == None:
+    try:
+        if SETTINGS.OVERWRITE_FILES == None:
+            raise MissingSettingException("OVERWRITE_FILES")
+    except:
         raise MissingSettingException("OVERWRITE_FILES")
-except:
-    raise MissingSettingException("OVERWRITE_FILES")
-try:
-    if SETTINGS.NEW_FILE_NAMES_SUFFIX == None:
+    try:
+        if SETTINGS.NEW_FILE_NAMES_SUFFIX == None:
+            raise MissingSettingException("NEW_FILE_NAMES_SUFFIX")
+    except:
         raise MissingSettingException("NEW_FILE_NAMES_SUFFIX")
-except:
-    raise MissingSettingException("NEW_FILE_NAMES_SUFFIX")
-try:
-    if SETTINGS.LOGS_FILE_NAME == None:
+    try:
+        if SETTINGS.LOGS_FILE_NAME == None:
+            raise MissingSettingException("LOGS_FILE_NAME")
+    except:
         raise MissingSettingException("LOGS_FILE_NAME")
-except:
-    raise MissingSettingException("LOGS_FILE_NAME")
-try:
-    if SETTINGS.STRINGS_FILE_NAME == None:
+    try:
+        if SETTINGS.STRINGS_FILE_NAME == None:
+            raise MissingSettingException("STRINGS_FILE_NAME")
+    except:
         raise MissingSettingException("STRINGS_FILE_NAME")
-except:
-    raise MissingSettingException("STRINGS_FILE_NAME")
-try:
-    if SETTINGS.BANNED_FILE_NAMES == None:
+    try:
+        if SETTINGS.BANNED_FILE_NAMES == None:
+            raise MissingSettingException("BANNED_FILE_NAMES")
+    except:
         raise MissingSettingException("BANNED_FILE_NAMES")
-except:
-    raise MissingSettingException("BANNED_FILE_NAMES")
-try:
-    if SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS == None:
+    try:
+        if SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS == None:
+            raise MissingSettingException("SKIP_FILES_WITH_UNIDENTIFIED_TAGS")
+    except:
         raise MissingSettingException("SKIP_FILES_WITH_UNIDENTIFIED_TAGS")
-except:
-    raise MissingSettingException("SKIP_FILES_WITH_UNIDENTIFIED_TAGS")
-
-
-
-strings = [] # array will contain all string objects
-
-# storing all strings in the provided file as objects:
-try:
-    with open(SCRIPT_DIR + SETTINGS.STRINGS_FILE_NAME, "r", encoding=SETTINGS.ENCODING) as strings_file:
-        count = 1
-        for line in strings_file:
-            s = line.split(SETTINGS.DELIMITER)
-            strings.append(ReplacementStr(s[0].strip("\n"),s[1].strip("\n")))
-            count += 1
-except IndexError:
-    raise LineMissingDelimeterException(count)
-except:
-    raise StringsFileException
-
-invalid_regex = [] # will store potential invalid regex in the strings file
-count = 1 # count 
-
-# Loop through the strings in the provided strings file, also check for the invalid regex
-# print("The following strings will be scanned and replaced (if found):")
-for string in strings:
-    regex_valid = valid_regex(string.find)
-    if regex_valid == False:
-        invalid_regex.append([string.find, count])
-    count += 1
-if count <= 1:
-    raise EmptyStringsFileException
-else:
-    print(f"{count-1} strings taken from the file {SETTINGS.STRINGS_FILE_NAME} will be found and replaced everywhere in the provided files if found.")
 
+# loads the strings file (relative to the script directory, or absolute), STRINGS_FILE_NAME if none is provided
+def load_strings(strings_filename: str = None) -> list[ReplacementStr]:
+    strings = [] # array will contain all string objects
+    # storing all strings in the provided file as objects:
+    try:
+        with open(os.path.join(SCRIPT_DIR, strings_filename or SETTINGS.STRINGS_FILE_NAME), "r", encoding=SETTINGS.ENCODING) as strings_file:
+            count = 1
+            for line in strings_file:
+                s = line.split(SETTINGS.DELIMITER)
+                strings.append(ReplacementStr(s[0].strip("\n"),s[1].strip("\n")))
+                count += 1
+    except IndexError:
+        raise LineMissingDelimeterException(count)
+    except:
+        raise StringsFileException
+    if not strings:
+        raise EmptyStringsFileException
+    return strings
 
-# If invalid regex exists, warn the user
-if invalid_regex and invalid_regex is not None:
-    print() # new line for readability
-    print("Warning! The program identified the following regex that were invalid:")
-    for invalid_item in invalid_regex:
-        print(f"Line {invalid_item[1]}: {invalid_item[0]}")
-del count # removes count since it is no longer necessary
-print() # new line for readability
+# returns the [find, line number] of every string whose regex is invalid
+def get_invalid_regex(strings: list[ReplacementStr]) -> list[list]:
+    invalid_regex = [] # will store potential invalid regex in the strings file
+    count = 1 # count
+    for string in strings:
+        regex_valid = valid_regex(string.find)
+        if regex_valid == False:
+            invalid_regex.append([string.find, count])
+        count += 1
+    return invalid_regex
 
+# opens the manifest if MANIFEST_FILE_NAME is set, returning it along with the fingerprint of the rules and settings.
+# Scans ignore the manifest, since they change no file.
+def open_manifest(strings: list[ReplacementStr]) -> tuple[Manifest | None, str | None]:
+    if not SETTINGS.MANIFEST_FILE_NAME or SETTINGS.SCAN_MODE != "OFF":
+        return None, None
+    return Manifest(os.path.join(SCRIPT_DIR, get_shard_file_name(SETTINGS.MANIFEST_FILE_NAME))), get_fingerprint(strings)
 
-if SETTINGS.RUN_WITH_WARNINGS:
-    a = input("Press any key to continue or q to CANCEL: ")
-    if a == 'q':
-        exit()
-    del a
+# returns the names of the files never processed: the banned files, and the strings, logs, config, manifest, journal and
+# profile files (along with the ones of every shard of a sharded run)
+def get_excluded_names(config_filename: str = "") -> set[str]:
+    names = [SETTINGS.STRINGS_FILE_NAME, config_filename]
+    for name in (SETTINGS.LOGS_FILE_NAME, SETTINGS.MANIFEST_FILE_NAME, SETTINGS.JOURNAL_FILE_NAME, SETTINGS.PROFILE_FILE_NAME):
+        names.append(name)
+        if SETTINGS.SHARD is not None:
+            names.extend(get_shard_file_name(name, (index, SETTINGS.SHARD[1])) for index in range(1, SETTINGS.SHARD[1] + 1))
+    return set(SETTINGS.BANNED_FILE_NAMES) | {os.path.basename(name) for name in names if name}
 
-extensions = tuple(SETTINGS.EXTENSIONS)
+# returns the files to process (relative to the directory being processed), found lazily. The strings, logs, config, journal
+# and profile files are left out, along with the files of other shards if SHARD is set and files up to date in the manifest
+# if one is provided.
+def find_files(config_filename: str = "", manifest: Manifest = None, fingerprint: str = None):
+    files = discover_files(get_files_dir(), get_excluded_names(config_filename))
+    if SETTINGS.SHARD is not None:
+        files = (file for file in files if is_in_shard(file, SETTINGS.SHARD))
+    if manifest is not None:
+        # files processed by a previous run with the same rules and settings, and not changed since, are left out
+        files = manifest.filter_up_to_date(files, fingerprint)
+    return files
 
-files_to_use = [] # array containing the filenames of the files to run the script with    
+# up to this many rules and files are listed in the profile report
+PROFILE_REPORT_SIZE = 20
+# rules spending at least this many seconds per attempt, and 10 times more than the median rule, are flagged as slow
+SLOW_ATTEMPT_SECONDS = 0.0001
+
+# returns True if a parsed regex repeats (without bound) something that itself contains a repeat without bound, such as
+# "(a+)+" or "(\w+\s?)*", which can take exponential time to fail (catastrophic backtracking)
+def has_nested_quantifiers(parsed, in_repeat: bool = False) -> bool:
+    for op, av in parsed:
+        if op in REPEAT_OPS:
+            unbounded = av[1] == sre_constants.MAXREPEAT
+            if unbounded and in_repeat:
+                return True
+            if has_nested_quantifiers(av[2], in_repeat or unbounded):
+                return True
+        elif op == sre_constants.SUBPATTERN:
+            if has_nested_quantifiers(av[3], in_repeat):
+                return True
+        elif op == sre_constants.BRANCH:
+            if any(has_nested_quantifiers(branch, in_repeat) for branch in av[1]):
+                return True
+        elif op == getattr(sre_constants, "ATOMIC_GROUP", None):
+            continue # atomic groups never backtrack into their contents
+    return False
+
+# The Profile gathers the rule statistics and the stage timings of every file processed when PROFILE_FILE_NAME is set,
+# keeping the slowest files, then writes the report of the slowest rules and files at the end of a run
+class Profile():
+    rule_stats: dict[int | tuple[int, int], list]
+    slowest_files: list[tuple[float, str, dict[str, float]]]
+
+    def __init__(self):
+        self.rule_stats = {}
+        self.slowest_files = [] # a heap of (seconds, file, timings), the fastest of them first
+
+    def add(self, file: str, result: FileResult):
+        for index, (seconds, attempts, hits) in result.rule_stats.items():
+            stat = self.rule_stats.setdefault(index, [0.0, 0, 0])
+            stat[0] += seconds
+            stat[1] += attempts
+            stat[2] += hits
+        entry = (sum(seconds for stage, seconds in result.timings.items() if stage != "log"), file, result.timings)
+        if len(self.slowest_files) < PROFILE_REPORT_SIZE:
+            heapq.heappush(self.slowest_files, entry)
+        elif entry[0] > self.slowest_files[0][0]:
+            heapq.heapreplace(self.slowest_files, entry)
+
+    # returns the reasons a rule is suspected of catastrophic backtracking, if any
+    def get_suspicions(self, string: ReplacementStr, stat: list, median_attempt: float) -> list[str]:
+        suspicions = []
+        parsed = parse_regex(string.find)
+        if parsed is not None and has_nested_quantifiers(parsed):
+            suspicions.append("nested quantifiers")
+        seconds, attempts, hits = stat
+        if attempts and seconds / attempts >= SLOW_ATTEMPT_SECONDS and seconds / attempts >= 10 * median_attempt:
+            suspicions.append(f"{seconds / attempts / median_attempt:.0f}x slower per attempt than the median rule" if median_attempt else "slow per attempt")
+        return suspicions
+
+    def write_report(self, file_name: str, strings: list[ReplacementStr], timings: dict[str, float]):
+        per_attempt = [seconds / attempts for seconds, attempts, hits in self.rule_stats.values() if attempts]
+        median_attempt = statistics.median(per_attempt) if per_attempt else 0.0
+        with open(file_name, "w", encoding=SETTINGS.ENCODING) as report:
+            report.write(f"Profile of the run finished at {datetime.now()}\n\n")
+            report.write("Time spent in each stage (seconds, summed over every file and worker):\n")
+            for stage, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+                report.write(f"  {stage:10} {seconds:10.3f}\n")
+            # consecutive literal rules applied together are timed as a group, each of them only being credited its hits
+            tried = sum(1 for seconds, attempts, hits in self.rule_stats.values() if attempts)
+            report.write(f"\nSlowest rules (of {tried} rules and groups of literal rules tried):\n")
+            report.write(f"  {'line':>6} {'seconds':>10} {'attempts':>10} {'hits':>10} {'us/attempt':>11}  regex\n")
+            slowest_rules = sorted(self.rule_stats.items(), key=lambda item: -item[1][0])[:PROFILE_REPORT_SIZE]
+            for key, (seconds, attempts, hits) in slowest_rules:
+                per_attempt_us = seconds / attempts * 1e6 if attempts else 0.0
+                if isinstance(key, tuple):
+                    line, regex = f"{key[0] + 1}-{key[1] + 1}", f"group of the {key[1] - key[0] + 1} literal rules of these lines"
+                else:
+                    line, regex = f"{key + 1}", strings[key].find
+                report.write(f"  {line:>6} {seconds:10.3f} {attempts:10} {hits:10} {per_attempt_us:11.1f}  {regex}\n")
+            report.write("\nSlowest files (seconds, then the time spent in each stage):\n")
+            for seconds, file, file_timings in sorted(self.slowest_files, reverse=True):
+                stages = ", ".join(f"{stage} {stage_seconds:.3f}" for stage, stage_seconds in file_timings.items() if stage != "log")
+                report.write(f"  {seconds:10.3f}  {file} ({stages})\n")
+            report.write("\nCatastrophic backtracking suspects:\n")
+            suspects = 0
+            for index, string in enumerate(strings): # rules never tried are still checked for nested quantifiers
+                suspicions = self.get_suspicions(string, self.rule_stats.get(index, [0.0, 0, 0]), median_attempt)
+                if suspicions:
+                    suspects += 1
+                    report.write(f"  line {index + 1}: {string.find} ({', '.join(suspicions)})\n")
+            if not suspects:
+                report.write("  none\n")
+
+# RunResult holds the outcome of processing many files, files_changed being the number of files with changes (or with
+# matches when scanning). timings holds the seconds spent in each stage over all files, summed over the worker processes
+# if any, "log" being the time spent writing logs and recording files in the manifest.
+class RunResult():
+    changes: int
+    files: int
+    files_changed: int
+    files_to_skip: list[str]
+    timings: dict[str, float]
+    profile: Profile | None
+
+    def __init__(self):
+        self.changes = 0
+        self.files = 0
+        self.files_changed = 0
+        self.files_to_skip = []
+        self.timings = {}
+        self.profile = Profile() if SETTINGS.PROFILE_FILE_NAME else None
+
+    # adds the outcome of another run to this one, the profile being left as it is
+    def add(self, other: "RunResult"):
+        self.changes += other.changes
+        self.files += other.files
+        self.files_changed += other.files_changed
+        self.files_to_skip.extend(other.files_to_skip)
+        for stage, seconds in other.timings.items():
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+# processes files (relative to the directory being processed) with a rule set compiled beforehand, which can be reused
+# for any number of runs. Logs are added to the logs file (of the shard if SHARD is set), the manifest (if any) is updated
+# but not saved, and each file is recorded in the journal (if any) as soon as it is done.
+def process_files(files, rule_set: RuleSet, manifest: Manifest = None, fingerprint: str = None, journal: "Journal" = None) -> RunResult:
+    run_result = RunResult()
+    if journal is not None:
+        files = journal.track(files)
+
+    def collect(file: str, result: FileResult):
+        started = time.perf_counter()
+        run_result.changes += collect_result(file, result, logs, rule_set.strings, manifest)
+        if journal is not None:
+            journal.record(file, result)
+        result.add_time("log", started)
+        run_result.files += 1
+        if result.changes and not result.skipped:
+            run_result.files_changed += 1
+        if result.skipped:
+            run_result.files_to_skip.append(file)
+        for stage, seconds in result.timings.items():
+            run_result.timings[stage] = run_result.timings.get(stage, 0.0) + seconds
+        if run_result.profile is not None:
+            run_result.profile.add(file, result)
+
+    # characters of the changes that ENCODING cannot hold are logged as escapes, instead of stopping the run
+    with open(os.path.join(SCRIPT_DIR, get_shard_file_name(SETTINGS.LOGS_FILE_NAME)), 'a', encoding=SETTINGS.ENCODING, errors="backslashreplace") as logs_file:
+        if SETTINGS.WORKERS > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            print("Warning! Multiple workers are not supported on this platform, files will be processed one at a time.")
+            SETTINGS.WORKERS = 1
+        if SETTINGS.WORKERS > 1:
+            # each file is handed to a worker process, results are received in the original order so logs match a serial run
+            pool_context = multiprocessing.get_context("fork")
+            with pool_context.Pool(SETTINGS.WORKERS, initializer=init_worker, initargs=(rule_set, fingerprint)) as pool:
+                with LogWriter(logs_file) as logs: # the writer thread is only started once the workers are forked
+                    for file, result in pool.imap(process_file_in_worker, files, chunksize=WORKER_CHUNK_SIZE):
+                        collect(file, result)
+        else:
+            with LogWriter(logs_file) as logs:
+                for file in files:
+                    collect(file, process_file(file, rule_set, fingerprint))
+    if run_result.profile is not None:
+        run_result.profile.write_report(os.path.join(SCRIPT_DIR, get_shard_file_name(SETTINGS.PROFILE_FILE_NAME)), rule_set.strings, run_result.timings)
+    return run_result
+
+# The Journal records every file processed by a run in its file as soon as it is done, one JSON line at a time appended to it,
+# so a run which was stopped (even killed) can be resumed where it stopped, leaving out the files it completed. Its first line
+# holds the fingerprint of the rules and settings, the shard and the scan mode of the run, and a last line is added once the
+# run is completed. A journal is only resumed by a run with the same first line; other runs, and runs following a completed
+# one, start a new journal.
+# When files are overwritten, each file is also recorded with its signature (see get_file_signature()) when it is handed out
+# for processing, since a killed run may have overwritten files it had no time to record as done (such as the files still
+# in the hands of worker processes): those whose signature changed are not processed again, so their changes are never
+# made twice. They are recorded as "interrupted", their changes not being known.
+class Journal():
+    file_name: str
+    done: set[str]
+    files_done: int
+    journal_file: io.TextIOBase
+    lock: threading.Lock
+
+    def __init__(self, file_name: str, fingerprint: str):
+        self.file_name = file_name
+        self.files_done = 0
+        self.lock = threading.Lock() # files are handed out to worker processes by another thread than the one recording them
+        header = get_journal_header(fingerprint)
+        first_line, entries, completed = read_journal(file_name)
+        if first_line == header and not completed:
+            self.done = {entry["file"] for entry in entries if "file" in entry}
+            self.journal_file = open(file_name, "a", encoding="utf-8")
+            for entry in entries:
+                file = entry.get("started")
+                if file is not None and file not in self.done and entry["signature"] != list(get_file_signature(get_file_path(file)) or []):
+                    self.done.add(file)
+                    self.write({"file": file, "status": "interrupted", "changes": 0})
+        else:
+            self.done = set()
+            self.journal_file = open(file_name, "w", encoding="utf-8")
+            self.write(header)
+
+    def write(self, entry: dict):
+        with self.lock:
+            self.journal_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.journal_file.flush() # so the entry is not lost if the run is killed
+
+    # leaves out the files (relative to the directory being processed) completed by the stopped run being resumed, counting them
+    def filter_done(self, files):
+        for file in files:
+            if file in self.done:
+                self.files_done += 1
+            else:
+                yield file
+
+    # records each file (relative to the directory being processed) when it is handed out for processing, if files are overwritten
+    def track(self, files):
+        for file in files:
+            if SETTINGS.OVERWRITE_FILES and SETTINGS.SCAN_MODE == "OFF":
+                self.write({"started": file, "signature": list(get_file_signature(get_file_path(file)) or [])})
+            yield file
+
+    def record(self, file: str, result: FileResult):
+        status = "skipped" if result.skipped else "unchanged" if not result.changes else "changed" if SETTINGS.SCAN_MODE == "OFF" else "matched"
+        self.write({"file": file, "status": status, "changes": result.changes})
+
+    # marks the run as completed and closes the journal
+    def complete(self):
+        self.write({"completed": True, "time": datetime.now().isoformat()})
+        self.close()
+
+    def close(self):
+        self.journal_file.close()
+
+# returns the first line of the journal of a run
+def get_journal_header(fingerprint: str) -> dict:
+    shard = f"{SETTINGS.SHARD[0]}/{SETTINGS.SHARD[1]}" if SETTINGS.SHARD is not None else None
+    return {"fingerprint": fingerprint, "shard": shard, "scan_mode": SETTINGS.SCAN_MODE}
+
+# reads a journal, returning its first line, its other entries (files done and files started) and whether the run was
+# completed. A line cut short by a killed run is ignored.
+def read_journal(file_name: str) -> tuple[dict | None, list[dict], bool]:
+    first_line = None
+    entries = []
+    completed = False
+    try:
+        with open(file_name, "r", encoding="utf-8") as journal_file:
+            for index, line in enumerate(journal_file):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if index == 0:
+                    first_line = entry
+                elif entry.get("completed"):
+                    completed = True
+                else:
+                    entries.append(entry)
+    except FileNotFoundError:
+        pass
+    return first_line, entries, completed
+
+# opens the journal (of the shard if SHARD is set) if JOURNAL_FILE_NAME is set, resuming the run it holds if it was stopped
+def open_journal(strings: list[ReplacementStr]) -> Journal | None:
+    if not SETTINGS.JOURNAL_FILE_NAME:
+        return None
+    return Journal(os.path.join(SCRIPT_DIR, get_shard_file_name(SETTINGS.JOURNAL_FILE_NAME)), get_fingerprint(strings))
+
+# merges the runs of the shards of a run split into count shards, once they are all completed: the logs of every shard are
+# added to the logs file (in the order of the shards) then removed, and the totals of all shards are returned, counted from
+# their journals. If any shard is not completed, nothing is merged, and the shards which are not are returned along with
+# the totals so far.
+def merge_shards(count: int) -> tuple[RunResult, list[int]]:
+    run_result = RunResult()
+    incomplete = []
+    for index in range(1, count + 1):
+        first_line, entries, completed = read_journal(os.path.join(SCRIPT_DIR, get_shard_file_name(SETTINGS.JOURNAL_FILE_NAME, (index, count))))
+        if not completed:
+            incomplete.append(index)
+        for entry in entries:
+            if "file" not in entry:
+                continue
+            run_result.files += 1
+            run_result.changes += entry.get("changes", 0)
+            if entry.get("status") in ("changed", "matched", "interrupted"):
+                run_result.files_changed += 1
+            elif entry.get("status") == "skipped":
+                run_result.files_to_skip.append(entry["file"])
+    if incomplete:
+        return run_result, incomplete
+    logs_file_name = os.path.join(SCRIPT_DIR, SETTINGS.LOGS_FILE_NAME)
+    with open(logs_file_name, "ab") as logs_file:
+        for index in range(1, count + 1):
+            shard_logs_file_name = os.path.join(SCRIPT_DIR, get_shard_file_name(SETTINGS.LOGS_FILE_NAME, (index, count)))
+            if os.path.exists(shard_logs_file_name): # the logs of a shard are gone once merged
+                with open(shard_logs_file_name, "rb") as shard_logs_file:
+                    shutil.copyfileobj(shard_logs_file, logs_file)
+                logs_file.flush()
+                os.remove(shard_logs_file_name)
+    return run_result, incomplete
+
+# inotify flags, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+INOTIFY_EVENT = struct.Struct("iIII") # watch descriptor, mask, cookie and length of the name following the event
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+
+# returns the (modification time, size) of a file, None if it does not exist
+def get_file_signature(file_name: str) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+# The InotifyWatcher reports the files to use (see is_file_to_use()) written or moved into a directory tree, using inotify
+# through the C library. Every directory of the tree (down to MAX_DEPTH, without those matching EXCLUDE_GLOBS) is watched,
+# including the ones created or moved in while watching, whose files are then reported as well. OSError is raised if
+# inotify cannot be used, such as on other platforms than Linux or once the limit of watched directories is reached.
+class InotifyWatcher():
+    root_dir: str
+    excluded_names: set[str]
+    libc: ctypes.CDLL
+    fd: int
+    dirs: dict[int, tuple[str, int]]
+
+    def __init__(self, root_dir: str, excluded_names: set[str]):
+        self.root_dir = root_dir
+        self.excluded_names = excluded_names
+        try:
+            self.libc = ctypes.CDLL(None, use_errno=True)
+            self.libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify is not available ({e})")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify could not be started")
+        self.dirs = {} # (path relative to root_dir, depth) of each watched directory by watch descriptor
+        try:
+            self.add_dir("", 0)
+        except OSError:
+            self.close()
+            raise
+
+    # watches a directory and the ones below it, returning the files to use found in them
+    def add_dir(self, rel_dir: str, depth: int) -> list[str]:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(os.path.join(self.root_dir, rel_dir)), INOTIFY_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            if rel_dir == "" or errno == 28: # ENOSPC, too many directories watched: every directory has to be
+                raise OSError(errno, f"The directory {rel_dir or self.root_dir} could not be watched")
+            return [] # removed since it was found
+        self.dirs[wd] = (rel_dir, depth)
+        files = []
+        try:
+            with os.scandir(os.path.join(self.root_dir, rel_dir)) as entries:
+                for entry in entries:
+                    rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.is_dir_to_watch(rel_path, depth + 1):
+                            files.extend(self.add_dir(rel_path, depth + 1))
+                    elif entry.is_file() and is_file_to_use(rel_path, self.excluded_names):
+                        files.append(rel_path)
+        except OSError:
+            pass
+        return files
+
+    # stops watching a directory moved out of its place, and the ones below it
+    def remove_dir(self, rel_dir: str):
+        for wd, (watched_dir, depth) in list(self.dirs.items()):
+            if watched_dir == rel_dir or watched_dir.startswith(rel_dir + "/"):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.dirs[wd]
+
+    def is_dir_to_watch(self, rel_dir: str, depth: int) -> bool:
+        return (SETTINGS.MAX_DEPTH < 0 or depth <= SETTINGS.MAX_DEPTH) and not (SETTINGS.EXCLUDE_GLOBS and matches_globs(rel_dir, SETTINGS.EXCLUDE_GLOBS))
+
+    # waits up to timeout seconds for events, returning the files written or moved in. If events were lost, every file
+    # of the tree is returned.
+    def wait(self, timeout: float) -> list[str]:
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        files = []
+        try:
+            data = os.read(self.fd, 1024 * 1024)
+        except BlockingIOError:
+            return []
+        position = 0
+        while position < len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, position)
+            name = os.fsdecode(data[position + INOTIFY_EVENT.size:position + INOTIFY_EVENT.size + length].rstrip(b"\0"))
+            position += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                print("Warning! Too many changes were made at once to be followed, every file will be looked at again.")
+                return list(discover_files(self.root_dir, self.excluded_names))
+            if mask & IN_IGNORED: # the directory was removed
+                self.dirs.pop(wd, None)
+                continue
+            if wd not in self.dirs:
+                continue
+            rel_dir, depth = self.dirs[wd]
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            if mask & IN_ISDIR:
+                if mask & IN_MOVED_FROM:
+                    self.remove_dir(rel_path)
+                elif mask & (IN_CREATE | IN_MOVED_TO) and self.is_dir_to_watch(rel_path, depth + 1):
+                    files.extend(self.add_dir(rel_path, depth + 1))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and is_file_to_use(rel_path, self.excluded_names):
+                files.append(rel_path)
+        return files
+
+    def close(self):
+        os.close(self.fd)
+
+# The PollingWatcher reports the files to use in a directory tree which were added or changed (by modification time and size),
+# by going through the whole tree every WATCH_POLL_INTERVAL seconds. It is used where inotify is not available.
+class PollingWatcher():
+    root_dir: str
+    excluded_names: set[str]
+    snapshot: dict[str, tuple[int, int]]
+    next_scan: float
+
+    def __init__(self, root_dir: str, excluded_names: set[str]):
+        self.root_dir = root_dir
+        self.excluded_names = excluded_names
+        self.snapshot = self.scan()
+        self.next_scan = time.monotonic() + SETTINGS.WATCH_POLL_INTERVAL
+
+    # returns the signature (see get_file_signature()) of every file to use in the tree
+    def scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        for file in discover_files(self.root_dir, self.excluded_names):
+            signature = get_file_signature(os.path.join(self.root_dir, file))
+            if signature is not None:
+                snapshot[file] = signature
+        return snapshot
+
+    # waits up to timeout seconds, returning the files added or changed if the tree was gone through in the meantime
+    def wait(self, timeout: float) -> list[str]:
+        delay = self.next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return []
+        if delay > 0:
+            time.sleep(delay)
+        snapshot = self.scan()
+        files = [file for file, signature in snapshot.items() if self.snapshot.get(file) != signature]
+        self.snapshot = snapshot
+        self.next_scan = time.monotonic() + SETTINGS.WATCH_POLL_INTERVAL
+        return files
+
+    def close(self):
+        pass
+
+# returns the watcher for WATCH_ENGINE, inotify being used where available if AUTO
+def open_watcher(root_dir: str, excluded_names: set[str]) -> InotifyWatcher | PollingWatcher:
+    if SETTINGS.WATCH_ENGINE == "AUTO":
+        try:
+            return InotifyWatcher(root_dir, excluded_names)
+        except OSError as e:
+            print(f"Warning! {e}, the directory will be polled every {SETTINGS.WATCH_POLL_INTERVAL} seconds instead.")
+    return PollingWatcher(root_dir, excluded_names)
+
+# loads the strings file again, returning None (after printing why) if it cannot be used
+def reload_strings() -> list[ReplacementStr] | None:
+    try:
+        strings = load_strings()
+    except StringsFileException as e:
+        print(f"Warning! The strings file could not be reloaded, the previous strings are still used: {e}")
+        return None
+    invalid_regex = get_invalid_regex(strings)
+    if invalid_regex:
+        print("Warning! The strings file could not be reloaded, the previous strings are still used. It has invalid regex:")
+        for find, line in invalid_regex:
+            print(f"Line {line}: {find}")
+        return None
+    return strings
+
+# watches the directory being processed until interrupted (with Ctrl+C), processing each file to use created or changed in it
+# once it has been left unchanged for WATCH_DELAY seconds, with the rule set compiled beforehand. Files written by the script
+# itself (new files and overwritten files) are not processed again. When the strings file changes, the rules are compiled
+# again and every file is processed with them. The manifest (if any) is saved after each batch of files.
+# Returns the outcome of all the files processed.
+def watch_files(rule_set: RuleSet, manifest: Manifest = None, fingerprint: str = None, config_filename: str = "") -> RunResult:
+    strings_file_name = os.path.join(SCRIPT_DIR, SETTINGS.STRINGS_FILE_NAME)
+    strings_signature = get_file_signature(strings_file_name)
+    strings_changed = None # when the strings file was last seen changing, until it is reloaded
+    pending = {} # files to process, by when they were last seen changing
+    written = {} # signature of each file overwritten by the script, so the change it made is not processed again
+    run_result = RunResult()
+    watcher = open_watcher(get_files_dir(), get_excluded_names(config_filename))
+    print(f"Watching {get_files_dir()} for changes, press Ctrl+C to stop.")
+    try:
+        while True:
+            deadlines = [changed + SETTINGS.WATCH_DELAY for changed in pending.values()]
+            if strings_changed is not None:
+                deadlines.append(strings_changed + SETTINGS.WATCH_DELAY)
+            timeout = min([SETTINGS.WATCH_POLL_INTERVAL] + [deadline - time.monotonic() for deadline in deadlines])
+            for file in watcher.wait(max(timeout, 0)):
+                pending[file] = time.monotonic()
+            signature = get_file_signature(strings_file_name)
+            if signature != strings_signature:
+                strings_signature = signature
+                strings_changed = time.monotonic()
+            now = time.monotonic()
+            if strings_changed is not None and now - strings_changed >= SETTINGS.WATCH_DELAY and strings_signature is not None:
+                strings_changed = None
+                strings = reload_strings()
+                if strings is not None:
+                    rule_set = build_rule_set(strings)
+                    if manifest is not None:
+                        fingerprint = get_fingerprint(strings)
+                    print(f"{len(strings)} strings have been reloaded from the file {SETTINGS.STRINGS_FILE_NAME}, every file will be processed with them.")
+                    pending = {file: 0.0 for file in find_files(config_filename)}
+                    written = {}
+            files = sorted(file for file, changed in pending.items() if now - changed >= SETTINGS.WATCH_DELAY)
+            if not files:
+                continue
+            for file in files:
+                del pending[file]
+            files = [file for file in files if written.pop(file, None) != get_file_signature(get_file_path(file)) and os.path.isfile(get_file_path(file))]
+            if manifest is not None:
+                files = list(manifest.filter_up_to_date(files, fingerprint))
+            if not files:
+                continue
+            batch_result = process_files(files, rule_set, manifest, fingerprint)
+            run_result.add(batch_result)
+            if manifest is not None:
+                manifest.save()
+            if SETTINGS.OVERWRITE_FILES and SETTINGS.SCAN_MODE == "OFF":
+                for file in files:
+                    written[file] = get_file_signature(get_file_path(file))
+            print(f"{datetime.now()}: {batch_result.files} files processed, {batch_result.changes} changes made, {len(batch_result.files_to_skip)} files skipped.")
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        watcher.close()
+    return run_result
+
+# runs the script interactively, as when findrepl.py is started
+def main():
+    print("""
+        Warnings:
+        - Please read the "readme.txt" file before using the script.
+        - No lines can contain "\\n" in the config file.
+        - You can either run the script for hypertext files or non-hypertext files - not both at the same time
+        ----------------------------------------------------
+        """)
+
+    print(f"Script is currently located at: {SCRIPT_DIR}. This will be taken as the working directory if no custom directory is specified otherwise.\n")
+
+    if os.path.exists(SCRIPT_DIR + 'findrepl.cfg'): # check if findrepl.cfg is in the script's directory
+        print("Config file \"findrepl.cfg\" has been found in the script directory.")
+        config_filename = "findrepl.cfg"
+    else: # findrepl.cfg not found in script directory
+        config_filename = input("Enter the config file's filename, or press ENTER to continue with default settings: ")
+        if config_filename == "":
+            print("Script will run using the default settings listed below:")
+            print(f"DELIMITER: \"{SETTINGS.DELIMITER}\"")
+            print(f"Hypertext Support: {SETTINGS.HYPERTEXT_SUPPORT}")
+            print(f"Current Directory For Files: {SETTINGS.PROCESS_FILES_IN_CURRENT_DIR}")
+            print(f"Save log for files that will be scanned: {SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG}")
+            print(f"Run with warnings: {SETTINGS.RUN_WITH_WARNINGS}")
+            print(f"Extensions: {SETTINGS.EXTENSIONS}")
+            print(f"Banned tags: {SETTINGS.BANNED_TAGS}")
+            print(f"Default encoding: {SETTINGS.ENCODING}")
+            print(f"Overwrite Files: {SETTINGS.OVERWRITE_FILES}")
+            print(f"Suffix for new file names: \"{SETTINGS.NEW_FILE_NAMES_SUFFIX}\"")
+            print(f"Logs file filename: {SETTINGS.LOGS_FILE_NAME}")
+            print(f"Strings file filename: {SETTINGS.STRINGS_FILE_NAME}")
+            print(f"Skip Files with unidentified tags: {SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS}")
+            print(f"Workers: {SETTINGS.WORKERS}")
+            print(f"Max directory depth: {SETTINGS.MAX_DEPTH}")
+
+    if config_filename != "": # if a config file is provided
+        read_config(config_filename)
+
+    strings = load_strings()
+    print(f"{len(strings)} strings taken from the file {SETTINGS.STRINGS_FILE_NAME} will be found and replaced everywhere in the provided files if found.")
+
+    # If invalid regex exists, warn the user
+    invalid_regex = get_invalid_regex(strings)
+    if invalid_regex:
+        print() # new line for readability
+        print("Warning! The program identified the following regex that were invalid:")
+        for invalid_item in invalid_regex:
+            print(f"Line {invalid_item[1]}: {invalid_item[0]}")
+    print() # new line for readability
 
-if SETTINGS.PROCESS_FILES_IN_CURRENT_DIR:
-    for file in os.listdir(SCRIPT_DIR):
-        if file.endswith(extensions):
-            if file not in SETTINGS.BANNED_FILE_NAMES and file != SETTINGS.STRINGS_FILE_NAME and file != SETTINGS.LOGS_FILE_NAME and file != config_filename:
-                files_to_use.append(file)
-                    
-else:
-    for file in os.listdir(SETTINGS.FILES_CUSTOM_DIR):
-        if file.endswith(extensions):
-            if file not in SETTINGS.BANNED_FILE_NAMES and file != SETTINGS.STRINGS_FILE_NAME and file != SETTINGS.LOGS_FILE_NAME and file != config_filename:
-                files_to_use.append(file)
-
-if not files_to_use: # accounts for if no files will be affected
-    print("There are no files to be edited with the extension/s that you have provided.")
-    exit()
-else:
-    print(f"{len(files_to_use)} files will be searched.")
-    if SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG:
-        files_that_will_be_tweaked_file = open('change-files.log', "w", encoding=SETTINGS.ENCODING)
-        for file in files_to_use:
-            files_that_will_be_tweaked_file.write(file + "\n")
-        files_that_will_be_tweaked_file.close()
-        print("The files that will be used have been stored in a \"change-files.log\" file.")
     if SETTINGS.RUN_WITH_WARNINGS:
         a = input("Press any key to continue or q to CANCEL: ")
         if a == 'q':
-            exit()
-        del a
-total_changes = 0
-files_to_skip = []
-if files_to_use:
-    if SETTINGS.HYPERTEXT_SUPPORT == False: # for plaintext/non-hypertext files
-        with open(SCRIPT_DIR + SETTINGS.LOGS_FILE_NAME, 'a', encoding=SETTINGS.ENCODING) as logs:
-            for file in files_to_use:
-                if not SETTINGS.PROCESS_FILES_IN_CURRENT_DIR:
-                    file_name = f"{SETTINGS.FILES_CUSTOM_DIR}/{file}"
-                else:
-                    file_name = SCRIPT_DIR + file
-                with open(file_name, "r", encoding=SETTINGS.ENCODING) as original:
-                    file_split = file_name.split(".")
-                    new_file_name = f'{file_split[0]}{SETTINGS.NEW_FILE_NAMES_SUFFIX}.{file_split[1]}'
-                    print(new_file_name)
-                    with open(new_file_name, "w", encoding=SETTINGS.ENCODING) as new:
-                        changed_tags = False
-                        for i in original: # for each line in the original file
-                            for string in strings:
-                                if re.search(string.find, i):
-                                    changed_tags = True # used later to not delete _new file since changes were actually made.
-                                    old = str(i).strip("\n")
-                                    i = re.sub(string.find, string.replace, i)
-                                    new_log = i.strip("\n")
-                                    info = f'{file} CHANGE ({datetime.now()}): \"{old}\" --------> \"{new_log}\"\n'
-                                    logs.write(info)
-                                    total_changes += 1
-                            new.write(i)
-                    if changed_tags == False: # only delete file if there are no changed tags
-                        os.remove(new_file_name)
-    else: # for hypertext files
-        from bs4 import BeautifulSoup, Comment
-        with open(SCRIPT_DIR + SETTINGS.LOGS_FILE_NAME, 'a', encoding=SETTINGS.ENCODING) as logs: 
+            return
+
+    manifest, fingerprint = open_manifest(strings)
+    files_to_use = find_files(config_filename, manifest, fingerprint) # files are found lazily, while earlier ones are being processed
+    journal = open_journal(strings)
+    if journal is not None:
+        files_to_use = journal.filter_done(files_to_use)
+
+    if SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG or SETTINGS.RUN_WITH_WARNINGS: # the full list is needed before starting
+        files_to_use = list(files_to_use)
+        if not files_to_use: # accounts for if no files will be affected
+            print("There are no files to be edited with the extension/s that you have provided.")
+            if manifest is not None:
+                manifest.save()
+            if journal is not None:
+                journal.complete()
+            return
+        print(f"{len(files_to_use)} files will be searched.")
+        if SETTINGS.SAVE_FILES_THAT_WILL_BE_SCANNED_LOG:
+            files_that_will_be_tweaked_file = open('change-files.log', "w", encoding=SETTINGS.ENCODING)
             for file in files_to_use:
-                if not SETTINGS.PROCESS_FILES_IN_CURRENT_DIR:
-                    file_name = f"{SETTINGS.FILES_CUSTOM_DIR}/{file}"
-                else:
-                    file_name = SCRIPT_DIR + file
-                with open(file_name, "r", encoding=SETTINGS.ENCODING) as original:
-                    changed_tags = False
-                    has_unidentified_tags = False
-                    file_split = file_name.split(".")
-                    if file_split[1] == "xml": # to preserve XML (case sensitivity, etc)
-                        soup = BeautifulSoup(original, 'xml')
-                    else:
-                        soup = BeautifulSoup(original, 'lxml')
-                    for string in strings:
-                        tags_with_changes = soup.find_all(string=re.compile(string.find))
-                        for tag in tags_with_changes:
-                            if SETTINGS.SKIP_FILES_WITH_UNIDENTIFIED_TAGS:
-                                print(tag.name)
-                                if tag.name == None and file_split[1] != 'xml':
-                                    has_unidentified_tags = True
-                                    changed_tags = False
-                                    files_to_skip.append(file)
-                                    info = f"{file} SKIPPED ({datetime.now()}): The file contains an unidentified tag (such as '<? ... ?>'), and has been skipped due to this reason"
-                                    print(info) # this is being printed to CLI as well since it is important for the user to know and likely rare for most use cases.
-                                    logs.write(info)
-                                    # break # breaks out of inner loop (for tag in tags_with_changes)
-                            if (tag.parent.name not in SETTINGS.BANNED_TAGS) and (not isinstance(tag, Comment)):
-                                old = str(tag.text).strip("\n")
-                                new_tag = re.sub(string.find,string.replace,tag)
-                                tag.replace_with(new_tag)
-                                new_log = new_tag.strip("\n")
-                                info = f'{file} CHANGE ({datetime.now()}): \"{old}\" --------> \"{new_log}\"\n'
-                                logs.write(info)
-                                total_changes += 1
-                                changed_tags = True
-                        if has_unidentified_tags:
-                            pass # break # breaks out of outer loop (for string in strings)
-                    if changed_tags and not has_unidentified_tags:
-                        new_file_name = f'{file_split[0]}{SETTINGS.NEW_FILE_NAMES_SUFFIX}.{file_split[1]}'
-                        with open(new_file_name, "w", encoding=SETTINGS.ENCODING) as new:
-                            soup.prettify(formatter=None)
-                            soup.encode(SETTINGS.ENCODING)
-                            new.write(str(soup))
-                    tags_with_changes = None
-    if SETTINGS.OVERWRITE_FILES:
-        for file in files_to_use:
-            if file not in files_to_skip:
-                if not SETTINGS.PROCESS_FILES_IN_CURRENT_DIR:
-                    file_name = f"{SETTINGS.FILES_CUSTOM_DIR}/{file}"
-                else:
-                    file_name = SCRIPT_DIR + file
-                file_split = file_name.split(".")
-                new_file_name = f'{file_split[0]}{SETTINGS.NEW_FILE_NAMES_SUFFIX}.{file_split[1]}'
-                if os.path.exists(new_file_name):
-                    with open(file_name, "w", encoding=SETTINGS.ENCODING) as original:
-                        with open(new_file_name, "r", encoding=SETTINGS.ENCODING) as new:
-                            for line in new:
-                                original.write(line)
-                    os.remove(new_file_name)
-
-print(f"Script has successfully completed running. {total_changes} changes were made in total.")
-print(f"If any actions (changes or files being skipped) were logged, they have been added to the {SETTINGS.LOGS_FILE_NAME} file.")
-
-input('Press the Enter key to continue')
+                files_that_will_be_tweaked_file.write(file + "\n")
+            files_that_will_be_tweaked_file.close()
+            print("The files that will be used have been stored in a \"change-files.log\" file.")
+        if SETTINGS.RUN_WITH_WARNINGS:
+            a = input("Press any key to continue or q to CANCEL: ")
+            if a == 'q':
+                return
+    else:
+        first_file = next(files_to_use, None)
+        if first_file is None: # accounts for if no files will be affected
+            print("There are no files to be edited with the extension/s that you have provided.")
+            if manifest is not None:
+                manifest.save()
+            if journal is not None:
+                journal.complete()
+            return
+        files_to_use = itertools.chain([first_file], files_to_use)
+    rule_set = build_rule_set(strings) # all rules are compiled once here instead of once per line or per tag
+    run_result = process_files(files_to_use, rule_set, manifest, fingerprint, journal)
+    if manifest is not None:
+        manifest.save()
+        print(f"{manifest.files_up_to_date} files were left out since they have not changed since they were last processed.")
+    if journal is not None:
+        journal.complete()
+        if journal.files_done:
+            print(f"{journal.files_done} files were left out since they were completed by the stopped run being resumed.")
+
+    if SETTINGS.SCAN_MODE != "OFF":
+        print(f"Script has successfully completed scanning. {run_result.files_changed} of {run_result.files} files have matches, no file was changed.")
+    else:
+        print(f"Script has successfully completed running. {run_result.changes} changes were made in total.")
+    print(f"If any actions (changes or files being skipped) were logged, they have been added to the {get_shard_file_name(SETTINGS.LOGS_FILE_NAME)} file.")
+    if run_result.profile is not None:
+        print(f"The profile of the run (slowest rules and files) has been saved to the {get_shard_file_name(SETTINGS.PROFILE_FILE_NAME)} file.")
+
+    input('Press the Enter key to continue')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse # for the command line flags
+import contextlib # for silencing the output of the engines
+import os # for resolving paths given on the command line
+import signal # for stopping watch mode when terminated
+import sys # for the exit code and error output
+
+import findrepl
+
+# builds the parser of the command line flags
+def get_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="findrepl_cli.py", description="Finds and replaces regex in files without ever prompting. Settings are read from a config file, then from the flags.")
+    parser.add_argument("--config", default=findrepl.SCRIPT_DIR + "findrepl.cfg", help="config file to read settings from (default: findrepl.cfg next to findrepl.py). Use an empty value to start from the default settings.")
+    parser.add_argument("--strings", help="strings file, instead of STRINGS_FILE_NAME")
+    parser.add_argument("--dir", help="directory whose files are processed, instead of the one set in the config file")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="sets a setting as it would be written in a config file, can be repeated")
+    parser.add_argument("--scan", choices=["ANY", "RULES", "COUNTS"], help="only reports the files and rules with matches in the logs file, without changing any file (same as --set SCAN_MODE=...)")
+    parser.add_argument("--shard", metavar="I/N", help="only processes the files of shard I of N (from 1/N to N/N), files being split by a hash of their path, with logs, manifest, journal and profile files of its own (same as --set SHARD=I/N)")
+    parser.add_argument("--merge", type=int, metavar="N", help="instead of processing files, merges the logs and totals of a run split into N shards once every shard is completed, which requires JOURNAL_FILE_NAME")
+    parser.add_argument("--watch", action="store_true", help="after processing the files, keeps watching the directory being processed and processes each file created or changed in it, until stopped with Ctrl+C")
+    parser.add_argument("--quiet", action="store_true", help="only print the final summary")
+    parser.add_argument("files", nargs="*", help="files to process, relative to the directory being processed (default: every file found)")
+    return parser
+
+# runs the script non-interactively, returning the exit code: 0 on success, 1 if shards to merge are not all completed,
+# 2 if the settings or strings are invalid
+def main(argv: list[str] = None) -> int:
+    args = get_argument_parser().parse_args(argv)
+    verbose = not args.quiet
+    try:
+        config_filename = ""
+        if args.config:
+            config_filename = os.path.abspath(args.config)
+            findrepl.read_config(config_filename, verbose)
+        else:
+            findrepl.reset_settings()
+        for setting in args.set:
+            key, separator, value = setting.partition("=")
+            if not separator or key not in findrepl.SETTING_NAMES:
+                raise findrepl.InvalidSettingException(setting, "Unknown setting given with --set:")
+            findrepl.apply_setting(key, value, verbose)
+        if args.scan:
+            findrepl.SETTINGS.SCAN_MODE = args.scan
+        if args.shard:
+            findrepl.SETTINGS.SHARD = findrepl.parse_shard(args.shard)
+            if findrepl.SETTINGS.SHARD is None:
+                raise findrepl.InvalidSettingException(args.shard, "Invalid shard given with --shard, expected I/N such as 1/4:")
+        if args.merge is not None and (args.merge < 1 or not findrepl.SETTINGS.JOURNAL_FILE_NAME):
+            raise findrepl.InvalidSettingException(str(args.merge), "--merge needs JOURNAL_FILE_NAME to be set and a number of shards of at least 1:")
+        if args.dir:
+            findrepl.SETTINGS.PROCESS_FILES_IN_CURRENT_DIR = False
+            findrepl.SETTINGS.FILES_CUSTOM_DIR = os.path.abspath(args.dir)
+        if args.strings:
+            findrepl.SETTINGS.STRINGS_FILE_NAME = os.path.abspath(args.strings)
+        findrepl.check_settings()
+        if args.merge is not None:
+            return merge(args.merge)
+        strings = findrepl.load_strings()
+        invalid_regex = findrepl.get_invalid_regex(strings)
+        if invalid_regex:
+            for find, line in invalid_regex:
+                print(f"Line {line}: {find}", file=sys.stderr)
+            raise findrepl.InvalidSettingException(findrepl.SETTINGS.STRINGS_FILE_NAME, "Invalid regex found in the strings file:")
+    except (findrepl.InvalidSettingException, findrepl.MissingSettingException, findrepl.StringsFileException, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    manifest, fingerprint = findrepl.open_manifest(strings)
+    if args.files:
+        files = args.files
+        if findrepl.SETTINGS.SHARD is not None:
+            files = [file for file in files if findrepl.is_in_shard(file, findrepl.SETTINGS.SHARD)]
+        if manifest is not None:
+            files = manifest.filter_up_to_date(files, fingerprint)
+    else:
+        files = findrepl.find_files(config_filename, manifest, fingerprint)
+    journal = findrepl.open_journal(strings)
+    if journal is not None:
+        files = journal.filter_done(files)
+    rule_set = findrepl.build_rule_set(strings)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull if args.quiet else sys.stdout):
+        run_result = findrepl.process_files(files, rule_set, manifest, fingerprint, journal)
+        if manifest is not None:
+            manifest.save()
+        if journal is not None:
+            journal.complete()
+            if journal.files_done:
+                print(f"{journal.files_done} files were left out since they were completed by the stopped run being resumed.")
+        if args.watch:
+            signal.signal(signal.SIGTERM, signal.default_int_handler) # stops watching as Ctrl+C does, so the logs and manifest are saved
+            run_result.add(findrepl.watch_files(rule_set, manifest, fingerprint, config_filename))
+    if findrepl.SETTINGS.SCAN_MODE != "OFF":
+        print(f"{run_result.files} files scanned, {run_result.files_changed} files with matches, {len(run_result.files_to_skip)} files would be skipped.")
+    else:
+        print(f"{run_result.files} files processed, {run_result.changes} changes made, {len(run_result.files_to_skip)} files skipped.")
+    return 0
+
+# merges the logs and totals of a run split into count shards, returning the exit code
+def merge(count: int) -> int:
+    run_result, incomplete = findrepl.merge_shards(count)
+    if incomplete:
+        print(f"Error: shards {', '.join(str(index) for index in incomplete)} of {count} are not completed, nothing was merged.", file=sys.stderr)
+        print(f"{run_result.files} files processed so far, {run_result.changes} changes made.", file=sys.stderr)
+        return 1
+    print(f"{count} shards merged into {findrepl.SETTINGS.LOGS_FILE_NAME}.")
+    if findrepl.SETTINGS.SCAN_MODE != "OFF":
+        print(f"{run_result.files} files scanned, {run_result.files_changed} files with matches, {len(run_result.files_to_skip)} files would be skipped.")
+    else:
+        print(f"{run_result.files} files processed, {run_result.changes} changes made, {len(run_result.files_to_skip)} files skipped.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())